@@ -1,37 +1,145 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+from utils.metrics import instrument_engine, instrument_sessions
+from utils.profiling import profile_engine
+
 load_dotenv()
 
 # URL del database - SQLite per sviluppo, PostgreSQL per produzione
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./social_app.db")
 
-# Configurazione per SQLite
+# Pool di connessioni (PostgreSQL): connessioni stabili, extra sotto carico e attesa massima per ottenerne una
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Verifica la connessione prima dell'uso e la ricrea dopo DB_POOL_RECYCLE secondi (-1 per disattivare)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Durata massima di una singola query lato server, in millisecondi (0 per disattivare)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+# PRAGMA applicati a ogni nuova connessione SQLite: con WAL i lettori non bloccano lo scrittore
+# e busy_timeout fa attendere il lock invece di fallire subito con "database is locked"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Valori negativi indicano KiB (default 64 MiB per connessione)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+
+def get_engine_options(url: str) -> dict:
+    """Opzioni di create_engine/create_async_engine per il database indicato dall'URL"""
+    if url.startswith("sqlite"):
+        # Il timeout del driver copre anche l'apertura della connessione, prima dei PRAGMA
+        connect_args = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if not url.startswith("sqlite+aiosqlite"):
+            connect_args["check_same_thread"] = False
+        return {"connect_args": connect_args}
+    
+    connect_args = {}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        if "+asyncpg" in url:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        elif url.startswith("postgres"):
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "connect_args": connect_args
+    }
+
+def apply_sqlite_pragmas(engine: Engine) -> None:
+    """Registra un listener che configura ogni nuova connessione SQLite del motore"""
+    
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.close()
+
+engine = create_engine(DATABASE_URL, **get_engine_options(DATABASE_URL))
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        DATABASE_URL, 
-        connect_args={"check_same_thread": False}
-    )
-else:
-    # Configurazione per PostgreSQL
-    engine = create_engine(DATABASE_URL)
+    apply_sqlite_pragmas(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def get_async_database_url(url: str) -> str:
+    """Converte l'URL del database nell'equivalente con driver asincrono (aiosqlite, asyncpg)"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+asyncpg:", 1)
+    return url
+
+# Engine asincrono usato dalle rotte e dai worker, per non bloccare l'event loop
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", get_async_database_url(DATABASE_URL))
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **get_engine_options(ASYNC_DATABASE_URL))
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    apply_sqlite_pragmas(async_engine.sync_engine)
+
+# Metriche su durata delle query e attesa delle connessioni (esposte su /metrics)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+instrument_sessions()
+# Conteggio delle query per le richieste profilate (vedi utils/profiling.py)
+profile_engine(engine)
+profile_engine(async_engine.sync_engine)
+
+# expire_on_commit=False: gli oggetti restano leggibili dopo il commit senza nuove query implicite
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
-# Dependency per ottenere la sessione del database
-def get_db():
-    db = SessionLocal()
-    try:
+# Dependency per ottenere la sessione asincrona del database
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # Funzione per creare le tabelle
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+
+def upgrade_schema():
+    """Aggiunge alle tabelle già esistenti le colonne e gli indici definiti dopo la loro creazione.
+
+    create_all crea solo le tabelle mancanti: questa funzione porta allo schema corrente
+    i database creati con versioni precedenti dei modelli. È idempotente.
+    """
+    inspector = inspect(engine)
+    
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                # Le nuove colonne devono essere nullable o avere un server_default
+                column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+            
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
 
@@ -1,5 +1,7 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
 
@@ -7,14 +9,45 @@ import os
 from routes.auth_user import router as auth_router
 from routes.auth import router as social_auth_router
 from routes.posts import router as posts_router
+from services.connected_accounts import connected_accounts_cache
+from services.job_queue import worker_pool
+from services.media_storage import MEDIA_ROOT
+from services.scheduler import SCHEDULER_ENABLED, scheduler
+from services.token_refresher import TOKEN_REFRESH_ENABLED, token_refresher
+from utils.cache import platform_account_cache, principal_cache
+from utils.circuit_breaker import circuit_breakers
+from utils.http_client import init_http_client, close_http_client
+from utils.metrics import MetricsMiddleware, registry as metrics_registry
+from utils.profiling import ProfilingMiddleware
+from utils.rate_limit import rate_limiter
 
 # Carica le variabili d'ambiente
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Avvia e chiude le risorse condivise dell'applicazione"""
+    # Client HTTP condiviso con pool di connessioni verso le piattaforme social
+    await init_http_client()
+    # Worker che consumano la coda dei job di pubblicazione
+    await worker_pool.start()
+    # Scheduler dei post programmati
+    if SCHEDULER_ENABLED:
+        await scheduler.start()
+    # Refresh dei token OAuth in scadenza
+    if TOKEN_REFRESH_ENABLED:
+        await token_refresher.start()
+    yield
+    await token_refresher.stop()
+    await scheduler.stop()
+    await worker_pool.stop()
+    await close_http_client()
+
 app = FastAPI(
     title="Social Multiplatform Publisher",
     description="API per pubblicare contenuti su multiple piattaforme social",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurazione CORS
@@ -24,13 +57,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursore della pagina successiva di /posts/history
+    expose_headers=["X-Next-Cursor", "Link"],
 )
+# Latenza delle richieste per rotta, esposta su /metrics
+app.add_middleware(MetricsMiddleware)
+# Profiling su richiesta (header X-Profile) o a campione, se PROFILING_ENABLED
+app.add_middleware(ProfilingMiddleware)
 
 # Inclusione delle rotte
 app.include_router(auth_router)
 app.include_router(social_auth_router)
 app.include_router(posts_router)
 
+# File caricati tramite /posts/media: i nomi sono hash del contenuto, quindi immutabili
+os.makedirs(MEDIA_ROOT, exist_ok=True)
+app.mount("/media", StaticFiles(directory=MEDIA_ROOT), name="media")
+
 @app.get("/")
 async def root():
     return {"message": "Social Multiplatform Publisher API"}
@@ -39,6 +82,28 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/caches")
+async def cache_stats():
+    """Contatori di hit/miss delle cache in memoria di questo processo"""
+    return {
+        "principals": principal_cache.stats(),
+        "platform_accounts": platform_account_cache.stats(),
+        "connected_accounts": connected_accounts_cache.stats()
+    }
+
+@app.get("/health/publishing")
+async def publishing_stats():
+    """Stato dei rate limiter e dei circuit breaker verso le piattaforme social in questo processo"""
+    return {
+        "rate_limits": rate_limiter.stats(),
+        "circuit_breakers": circuit_breakers.stats()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metriche di questo processo nel formato di esposizione Prometheus"""
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -1,8 +1,16 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
+from sqlalchemy import Boolean, Column, Date, ForeignKey, Integer, String, DateTime, Text, Index, UniqueConstraint
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from db.database import Base
 
+# Su SQLite CURRENT_TIMESTAMP salva le date al secondo: i parametri vengono formattati allo stesso modo,
+# altrimenti il confronto tra stringhe dei cursori di paginazione fallirebbe sui valori uguali
+TimestampSeconds = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -11,6 +19,8 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
+    # Incrementata a ogni modifica di post, risultati o token dell'utente: base degli ETag
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -19,6 +29,10 @@ class User(Base):
 
 class SocialToken(Base):
     __tablename__ = "social_tokens"
+    __table_args__ = (
+        # Indice usato dal refresher per trovare i token in scadenza
+        Index("ix_social_tokens_expires_at", "expires_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -31,6 +45,9 @@ class SocialToken(Base):
     platform_user_id = Column(String, nullable=True)  # ID dell'utente sulla piattaforma social
     platform_username = Column(String, nullable=True)  # Username sulla piattaforma social
     is_active = Column(Boolean, default=True)
+    refresh_failed_at = Column(DateTime(timezone=True), nullable=True)  # Refresh rifiutato dalla piattaforma: serve una nuova connessione
+    refresh_error = Column(Text, nullable=True)
+    refresh_locked_at = Column(DateTime(timezone=True), nullable=True)  # Lease del refresher che sta rinnovando il token
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -39,20 +56,66 @@ class SocialToken(Base):
 
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # Indice usato dallo scheduler per trovare i post programmati in scadenza
+        Index("ix_posts_status_scheduled_at", "status", "scheduled_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=False)
+    # Deprecate: copie JSON di post_media e post_targets, solo scritte (per un eventuale rollback) e mai
+    # lette dall'applicazione. I post precedenti alle tabelle figlie vanno migrati con migrate_post_targets.py
     media_urls = Column(Text, nullable=True)  # JSON string con URLs dei media
     platforms = Column(String, nullable=False)  # JSON string con le piattaforme selezionate
-    status = Column(String, default="draft")  # draft, published, failed
+    status = Column(String, default="draft")  # draft, scheduled, queued, publishing, published, partially_published, failed
     scheduled_at = Column(DateTime(timezone=True), nullable=True)
     published_at = Column(DateTime(timezone=True), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(TimestampSeconds, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relazione con l'utente
     user = relationship("User")
+    
+    # Risultati della pubblicazione per piattaforma
+    results = relationship("PostResult", back_populates="post")
+    
+    # Piattaforme selezionate e media, una riga per elemento
+    targets = relationship("PostTarget", back_populates="post", order_by="PostTarget.position")
+    media = relationship("PostMedia", back_populates="post", order_by="PostMedia.position")
+
+# Indice per la cronologia paginata a cursore: (user_id, created_at DESC, id DESC)
+Index("ix_posts_user_id_created_at_id", Post.user_id, Post.created_at.desc(), Post.id.desc())
+
+class PostTarget(Base):
+    __tablename__ = "post_targets"
+    __table_args__ = (
+        UniqueConstraint("post_id", "platform", name="uq_post_targets_post_id_platform"),
+        # Indice per filtrare e aggregare i post per piattaforma
+        Index("ix_post_targets_platform_post_id", "platform", "post_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
+    platform = Column(String, nullable=False)
+    position = Column(Integer, nullable=False, default=0)  # Ordine della piattaforma nella richiesta
+
+    # Relazione con il post
+    post = relationship("Post", back_populates="targets")
+
+class PostMedia(Base):
+    __tablename__ = "post_media"
+    __table_args__ = (
+        UniqueConstraint("post_id", "position", name="uq_post_media_post_id_position"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    url = Column(Text, nullable=False)
+
+    # Relazione con il post
+    post = relationship("Post", back_populates="media")
 
 class PostResult(Base):
     __tablename__ = "post_results"
@@ -63,9 +126,45 @@ class PostResult(Base):
     platform_post_id = Column(String, nullable=True)  # ID del post sulla piattaforma
     status = Column(String, nullable=False)  # success, failed
     error_message = Column(Text, nullable=True)
+    latency_ms = Column(Integer, nullable=True)  # Durata della pubblicazione sulla piattaforma
     published_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relazione con il post
-    post = relationship("Post")
+    post = relationship("Post", back_populates="results")
+
+class PublishStatsDaily(Base):
+    """Statistiche giornaliere di pubblicazione per utente e piattaforma, aggiornate a ogni PostResult"""
+    __tablename__ = "publish_stats_daily"
 
+    # La chiave (user_id, day, platform) serve anche le letture per intervallo di date della dashboard
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # Giorno UTC
+    platform = Column(String, primary_key=True)
+    success_count = Column(Integer, nullable=False, default=0)
+    failure_count = Column(Integer, nullable=False, default=0)
+    latency_count = Column(Integer, nullable=False, default=0)  # Esiti con latenza misurata
+    latency_ms_total = Column(Integer, nullable=False, default=0)
+    latency_ms_max = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class PublishJob(Base):
+    __tablename__ = "publish_jobs"
+    __table_args__ = (
+        # Indice usato dai worker per prelevare i job pronti in ordine
+        Index("ix_publish_jobs_status_available_at", "status", "available_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), nullable=False, index=True)
+    platform = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime(timezone=True), nullable=False)  # Da quando il job può essere eseguito
+    locked_at = Column(DateTime(timezone=True), nullable=True)  # Inizio dell'esecuzione da parte di un worker
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Relazione con il post
+    post = relationship("Post")
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Request, Response
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
@@ -11,7 +12,11 @@ import json
 
 from db.database import get_db
 from models.models import User, SocialToken
-from routes.auth_user import get_current_user
+from routes.auth_user import CurrentUser, get_current_user
+from services.connected_accounts import get_connected_accounts, remove_connected_account, store_connected_account
+from services.data_version import bump_data_version, etag_matches, get_data_version, make_etag
+from utils.cache import invalidate_token_caches
+from utils.http_client import get_http_client
 
 router = APIRouter(prefix="/social", tags=["social-auth"])
 
@@ -65,6 +70,8 @@ class SocialTokenResponse(BaseModel):
     platform_user_id: Optional[str]
     platform_username: Optional[str]
     is_active: bool
+    expires_at: Optional[datetime] = None
+    refresh_failed_at: Optional[datetime] = None
     created_at: datetime
 
     class Config:
@@ -73,7 +80,7 @@ class SocialTokenResponse(BaseModel):
 @router.get("/connect/{platform}")
 async def connect_social_platform(
     platform: str,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """Inizia il processo di connessione OAuth per una piattaforma social"""
     
@@ -110,7 +117,8 @@ async def oauth_callback(
     platform: str,
     code: str,
     state: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    http_client: httpx.AsyncClient = Depends(get_http_client)
 ):
     """Gestisce il callback OAuth e salva il token"""
     
@@ -135,7 +143,7 @@ async def oauth_callback(
         )
     
     # Verifica che l'utente esista
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).filter(User.id == user_id))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -153,17 +161,16 @@ async def oauth_callback(
         "grant_type": "authorization_code"
     }
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(config["token_url"], data=token_data)
-            response.raise_for_status()
-            token_response = response.json()
-            
-        except httpx.HTTPError as e:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Failed to exchange code for token: {str(e)}"
-            )
+    try:
+        response = await http_client.post(config["token_url"], data=token_data)
+        response.raise_for_status()
+        token_response = response.json()
+        
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to exchange code for token: {str(e)}"
+        )
     
     # Estrae i dati del token
     access_token = token_response.get("access_token")
@@ -183,15 +190,18 @@ async def oauth_callback(
         expires_at = datetime.utcnow() + timedelta(seconds=int(expires_in))
     
     # Ottiene informazioni sull'utente della piattaforma
-    platform_user_info = await get_platform_user_info(platform, access_token)
+    platform_user_info = await get_platform_user_info(http_client, platform, access_token)
     
     # Salva o aggiorna il token nel database
-    existing_token = db.query(SocialToken).filter(
+    existing_token = await db.scalar(select(SocialToken).filter(
         SocialToken.user_id == user_id,
         SocialToken.platform == platform
-    ).first()
+    ))
     
     if existing_token:
+        # I dati risolti con il vecchio token (pagine, account collegati) non sono più validi
+        invalidate_token_caches(existing_token.access_token)
+        
         # Aggiorna il token esistente
         existing_token.access_token = access_token
         existing_token.refresh_token = refresh_token
@@ -200,7 +210,10 @@ async def oauth_callback(
         existing_token.platform_user_id = platform_user_info.get("id")
         existing_token.platform_username = platform_user_info.get("username")
         existing_token.is_active = True
+        existing_token.refresh_failed_at = None
+        existing_token.refresh_error = None
         existing_token.updated_at = datetime.utcnow()
+        saved_token = existing_token
     else:
         # Crea un nuovo token
         new_token = SocialToken(
@@ -216,14 +229,20 @@ async def oauth_callback(
             is_active=True
         )
         db.add(new_token)
+        saved_token = new_token
+    
+    await bump_data_version(db, user_id)
+    await db.commit()
+    await db.refresh(saved_token)
     
-    db.commit()
+    # Aggiorna direttamente la cache degli account connessi dell'utente
+    store_connected_account(saved_token)
     
     # Redirect al frontend con successo
     frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
     return RedirectResponse(url=f"{frontend_url}/dashboard?connected={platform}")
 
-async def get_platform_user_info(platform: str, access_token: str) -> Dict:
+async def get_platform_user_info(client: httpx.AsyncClient, platform: str, access_token: str) -> Dict:
     """Ottiene le informazioni dell'utente dalla piattaforma social"""
     
     user_info_urls = {
@@ -239,57 +258,68 @@ async def get_platform_user_info(platform: str, access_token: str) -> Dict:
     
     headers = {"Authorization": f"Bearer {access_token}"}
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(user_info_urls[platform], headers=headers)
-            response.raise_for_status()
-            user_data = response.json()
+    try:
+        response = await client.get(user_info_urls[platform], headers=headers)
+        response.raise_for_status()
+        user_data = response.json()
+        
+        # Normalizza i dati per ogni piattaforma
+        if platform == "facebook":
+            return {"id": user_data.get("id"), "username": user_data.get("name")}
+        elif platform == "instagram":
+            return {"id": user_data.get("id"), "username": user_data.get("username")}
+        elif platform == "linkedin":
+            return {"id": user_data.get("id"), "username": user_data.get("localizedFirstName", "")}
+        elif platform == "twitter":
+            data = user_data.get("data", {})
+            return {"id": data.get("id"), "username": data.get("username")}
+        elif platform == "tiktok":
+            data = user_data.get("data", {})
+            return {"id": data.get("user_id"), "username": data.get("display_name")}
             
-            # Normalizza i dati per ogni piattaforma
-            if platform == "facebook":
-                return {"id": user_data.get("id"), "username": user_data.get("name")}
-            elif platform == "instagram":
-                return {"id": user_data.get("id"), "username": user_data.get("username")}
-            elif platform == "linkedin":
-                return {"id": user_data.get("id"), "username": user_data.get("localizedFirstName", "")}
-            elif platform == "twitter":
-                data = user_data.get("data", {})
-                return {"id": data.get("id"), "username": data.get("username")}
-            elif platform == "tiktok":
-                data = user_data.get("data", {})
-                return {"id": data.get("user_id"), "username": data.get("display_name")}
-                
-        except httpx.HTTPError:
-            return {}
+    except httpx.HTTPError:
+        return {}
     
     return {}
 
 @router.get("/tokens", response_model=List[SocialTokenResponse])
 async def get_user_social_tokens(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    if_none_match: Optional[str] = Header(None)
 ):
-    """Ottiene tutti i token social dell'utente corrente"""
-    
-    tokens = db.query(SocialToken).filter(
-        SocialToken.user_id == current_user.id,
-        SocialToken.is_active == True
-    ).all()
-    
-    return tokens
+    """Ottiene tutti i token social dell'utente corrente.
+
+    Risponde 304 se l'ETag inviato in If-None-Match corrisponde alla versione corrente dei dati.
+    """
+    
+    # La versione viene letta prima dei dati: una scrittura concorrente produce al più un ETag già superato
+    version = await get_data_version(db, current_user.id)
+    etag = make_etag("social/tokens", current_user.id, version)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    
+    # La cache è usata solo se è stata caricata con la stessa versione dell'ETag,
+    # altrimenti gli account vengono riletti dal database
+    accounts = await get_connected_accounts(db, current_user.id, version)
+    
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return list(accounts.values())
 
 @router.delete("/disconnect/{platform}")
 async def disconnect_social_platform(
     platform: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Disconnette una piattaforma social"""
     
-    token = db.query(SocialToken).filter(
+    token = await db.scalar(select(SocialToken).filter(
         SocialToken.user_id == current_user.id,
         SocialToken.platform == platform
-    ).first()
+    ))
     
     if not token:
         raise HTTPException(
@@ -298,10 +328,13 @@ async def disconnect_social_platform(
         )
     
     # Disattiva il token invece di eliminarlo
+    invalidate_token_caches(token.access_token)
     token.is_active = False
     token.updated_at = datetime.utcnow()
     
-    db.commit()
+    await bump_data_version(db, current_user.id)
+    await db.commit()
+    remove_connected_account(current_user.id, platform)
     
     return {"message": f"Successfully disconnected from {platform}"}
 
@@ -1,15 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import timedelta
+import time
 
 from db.database import get_db
 from models.models import User
+from utils.cache import (
+    principal_cache,
+    token_fingerprint,
+    get_principal_generation,
+    invalidate_user_principals,
+    PRINCIPAL_CACHE_TTL
+)
 from utils.jwt import (
-    verify_password, 
-    get_password_hash, 
+    verify_and_update_password,
+    get_password_hash_async,
     create_access_token, 
     get_user_from_token,
     ACCESS_TOKEN_EXPIRE_MINUTES
@@ -42,47 +51,80 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class CurrentUser(BaseModel):
+    """Snapshot dell'utente autenticato, riutilizzabile tra richieste tramite la cache"""
+    id: int
+    email: str
+    username: str
+    is_active: bool
+
+    class Config:
+        from_attributes = True
+
+@event.listens_for(User.is_active, "set")
+def invalidate_deactivated_user(target, value, oldvalue, initiator):
+    """Rimuove dalla cache gli utenti autenticati quando vengono disattivati"""
+    if not value and target.id is not None:
+        invalidate_user_principals(target.id)
+
 # Dependency per ottenere l'utente corrente dal token
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
+    db: AsyncSession = Depends(get_db)
+) -> CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    # Token già verificato di recente: nessuna verifica della firma né query sul database
+    cache_key = token_fingerprint(credentials.credentials)
+    cached = principal_cache.get(cache_key)
+    if cached is not None:
+        generation, principal = cached
+        if generation == get_principal_generation(principal.id):
+            return principal
+        principal_cache.pop(cache_key)
+    
     user_data = get_user_from_token(credentials.credentials)
     if user_data is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_data["user_id"]).first()
-    if user is None:
+    generation = get_principal_generation(user_data["user_id"])
+    user = await db.scalar(select(User).filter(User.id == user_data["user_id"]))
+    if user is None or not user.is_active:
         raise credentials_exception
     
-    return user
+    principal = CurrentUser.model_validate(user)
+    
+    # La voce in cache non sopravvive mai alla scadenza del token
+    ttl = min(PRINCIPAL_CACHE_TTL, user_data["exp"] - time.time()) if user_data["exp"] else PRINCIPAL_CACHE_TTL
+    if ttl > 0:
+        principal_cache.set(cache_key, (generation, principal), ttl=ttl)
+    
+    return principal
 
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Registra un nuovo utente"""
     
     # Verifica se l'email esiste già
-    if db.query(User).filter(User.email == user_data.email).first():
+    if await db.scalar(select(User).filter(User.email == user_data.email)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
     # Verifica se l'username esiste già
-    if db.query(User).filter(User.username == user_data.username).first():
+    if await db.scalar(select(User).filter(User.username == user_data.username)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
     
     # Crea il nuovo utente
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     db_user = User(
         email=user_data.email,
         username=user_data.username,
@@ -90,13 +132,13 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     # Crea il token di accesso
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": db_user.id, "email": db_user.email, "username": db_user.username},
+        data={"sub": str(db_user.id), "email": db_user.email, "username": db_user.username},
         expires_delta=access_token_expires
     )
     
@@ -107,13 +149,17 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """Effettua il login dell'utente"""
     
     # Trova l'utente per email
-    user = db.query(User).filter(User.email == user_data.email).first()
+    user = await db.scalar(select(User).filter(User.email == user_data.email))
+    
+    password_valid, new_hash = False, None
+    if user:
+        password_valid, new_hash = await verify_and_update_password(user_data.password, user.hashed_password)
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -126,10 +172,15 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
             detail="Inactive user"
         )
     
+    # Aggiorna l'hash creato con parametri non più attuali (es. costo bcrypt aumentato)
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    
     # Crea il token di accesso
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.id, "email": user.email, "username": user.username},
+        data={"sub": str(user.id), "email": user.email, "username": user.username},
         expires_delta=access_token_expires
     )
     
@@ -140,7 +191,7 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     }
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: CurrentUser = Depends(get_current_user)):
     """Ottiene le informazioni dell'utente corrente"""
     return current_user
 
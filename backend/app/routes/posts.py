@@ -1,18 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status, Response
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import base64
 import httpx
 import json
 import os
+from dotenv import load_dotenv
 
 from db.database import get_db
-from models.models import User, SocialToken, Post, PostResult
-from routes.auth_user import get_current_user
+from models.models import Post, PostResult, PostTarget, PublishJob, PublishStatsDaily
+from routes.auth_user import CurrentUser, get_current_user
+from services.connected_accounts import get_connected_accounts, load_connected_accounts
+from services.data_version import bump_data_version, etag_matches, get_data_version, make_etag
+from services.job_queue import PUBLISH_MODE, enqueue_publish_jobs, worker_pool
+from services.media_storage import MEDIA_MAX_BODY_BYTES, MEDIA_MAX_BYTES, MediaTooLargeError, MediaTypeError, MediaUploadError, store_upload_stream
+from services.platforms import validate_post
+from services.post_targets import build_post_children, insert_post_children, post_platforms
+from services.publisher import publish_to_platforms, save_publish_outcomes, compute_post_status
+from services.scheduler import as_utc_naive, scheduler
+from utils.http_client import get_http_client
+
+load_dotenv()
 
 router = APIRouter(prefix="/posts", tags=["posts"])
 
+# Numero massimo di post accettati da una singola richiesta /posts/bulk
+BULK_MAX_POSTS = int(os.getenv("BULK_MAX_POSTS", "500"))
+# Intervallo di default e massimo (giorni) delle statistiche di /posts/stats
+STATS_DEFAULT_DAYS = int(os.getenv("STATS_DEFAULT_DAYS", "30"))
+STATS_MAX_DAYS = int(os.getenv("STATS_MAX_DAYS", "366"))
+
 class PostCreate(BaseModel):
     content: str
     platforms: List[str]
@@ -31,23 +52,104 @@ class PostResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class PostStatusResponse(BaseModel):
+    id: int
+    status: str
+    platforms: List[str]
+    pending_platforms: List[str] = []
+    results: List[Dict[str, Any]] = []
+
+class MediaUploadResponse(BaseModel):
+    url: str
+    sha256: str
+    size: int
+    content_type: str
+    deduplicated: bool
+
+class BulkPostCreate(BaseModel):
+    posts: List[PostCreate] = Field(..., min_length=1, max_length=BULK_MAX_POSTS)
+
+class BulkPostItemResult(BaseModel):
+    index: int
+    status: str  # created, rejected
+    post: Optional[PostResponse] = None
+    error: Optional[str] = None
+
+class BulkPostResponse(BaseModel):
+    created: int
+    rejected: int
+    results: List[BulkPostItemResult]
+
+class PublishStatsItem(BaseModel):
+    platform: str
+    day: Optional[date] = None  # Assente nei totali per piattaforma
+    success: int
+    failed: int
+    success_rate: float
+    avg_latency_ms: Optional[float] = None
+    max_latency_ms: Optional[int] = None
+
+class PublishStatsResponse(BaseModel):
+    from_date: date
+    to_date: date
+    days: List[PublishStatsItem]
+    totals: List[PublishStatsItem]
+
+def build_stats_item(platform: str, day: Optional[date], success: int, failed: int, latency_count: int, latency_total: int, latency_max: int) -> PublishStatsItem:
+    return PublishStatsItem(
+        platform=platform,
+        day=day,
+        success=success,
+        failed=failed,
+        success_rate=round(success / (success + failed), 4) if success + failed else 0.0,
+        avg_latency_ms=round(latency_total / latency_count, 1) if latency_count else None,
+        max_latency_ms=latency_max if latency_count else None
+    )
+
+def encode_history_cursor(post: Post) -> str:
+    """Codifica la posizione (created_at, id) di un post in un cursore opaco"""
+    raw = json.dumps([post.created_at.isoformat(), post.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor: str):
+    """Decodifica un cursore della cronologia in (created_at, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, post_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
 @router.post("/create", response_model=PostResponse)
 async def create_post(
     post_data: PostCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    http_client: httpx.AsyncClient = Depends(get_http_client)
 ):
     """Crea e pubblica un post su multiple piattaforme"""
     
-    # Verifica che l'utente abbia i token per le piattaforme richieste
-    user_tokens = db.query(SocialToken).filter(
-        SocialToken.user_id == current_user.id,
-        SocialToken.platform.in_(post_data.platforms),
-        SocialToken.is_active == True
-    ).all()
+    # I vincoli delle piattaforme (media obbligatori, lunghezza del testo) vengono verificati
+    # prima di qualsiasi accesso al database o chiamata remota
+    errors = validate_post(post_data.platforms, post_data.content, post_data.media_urls or [])
+    if errors:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="; ".join(errors)
+        )
+    
+    # Verifica che l'utente abbia i token per le piattaforme richieste (dalla cache degli account)
+    accounts = await get_connected_accounts(db, current_user.id)
+    missing_platforms = set(post_data.platforms) - set(accounts)
     
-    available_platforms = [token.platform for token in user_tokens]
-    missing_platforms = set(post_data.platforms) - set(available_platforms)
+    # Una connessione fatta da un altro processo può non essere ancora in cache: riprova sul database
+    if missing_platforms:
+        accounts = await load_connected_accounts(db, current_user.id)
+        missing_platforms = set(post_data.platforms) - set(accounts)
     
     if missing_platforms:
         raise HTTPException(
@@ -55,28 +157,67 @@ async def create_post(
             detail=f"Missing connections for platforms: {', '.join(missing_platforms)}"
         )
     
-    # Crea il record del post
+    # I token scaduti o non rinnovabili vengono rifiutati prima di qualsiasi chiamata remota
+    expired_platforms = [platform for platform in dict.fromkeys(post_data.platforms) if accounts[platform].needs_reconnect()]
+    if expired_platforms:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Reconnect required for platforms: {', '.join(expired_platforms)}"
+        )
+    
+    # Le date di programmazione sono salvate in UTC
+    scheduled_at = as_utc_naive(post_data.scheduled_at) if post_data.scheduled_at else None
+    
+    # Crea il record del post, con piattaforme e media nelle tabelle figlie
+    targets, media = build_post_children(post_data.platforms, post_data.media_urls or [])
     new_post = Post(
         user_id=current_user.id,
         content=post_data.content,
         media_urls=json.dumps(post_data.media_urls) if post_data.media_urls else None,
         platforms=json.dumps(post_data.platforms),
         status="publishing",
-        scheduled_at=post_data.scheduled_at
+        scheduled_at=scheduled_at,
+        targets=targets,
+        media=media
     )
+    # Piattaforme della risposta lette dalle righe appena create, prima che refresh() scarti la relazione
+    platforms = post_platforms(new_post)
     
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    # Ogni transazione che modifica i post dell'utente ne incrementa la versione (ETag della cronologia)
+    await bump_data_version(db, current_user.id)
+    await db.commit()
+    await db.refresh(new_post)
     
     # Se è programmato per il futuro, non pubblicare ora
-    if post_data.scheduled_at and post_data.scheduled_at > datetime.utcnow():
+    if scheduled_at and scheduled_at > datetime.utcnow():
         new_post.status = "scheduled"
-        db.commit()
+        await bump_data_version(db, current_user.id)
+        await db.commit()
+        scheduler.schedule(new_post.id, scheduled_at)
+        return PostResponse(
+            id=new_post.id,
+            content=new_post.content,
+            platforms=platforms,
+            status=new_post.status,
+            created_at=new_post.created_at,
+            published_at=new_post.published_at,
+            results=[]
+        )
+    
+    # In modalità coda accoda un job per piattaforma e risponde subito: pubblicano i worker
+    if PUBLISH_MODE == "queue":
+        new_post.status = "queued"
+        enqueue_publish_jobs(db, new_post, post_data.platforms)
+        await bump_data_version(db, current_user.id)
+        await db.commit()
+        worker_pool.notify()
+        
+        response.status_code = status.HTTP_202_ACCEPTED
         return PostResponse(
             id=new_post.id,
             content=new_post.content,
-            platforms=json.loads(new_post.platforms),
+            platforms=platforms,
             status=new_post.status,
             created_at=new_post.created_at,
             published_at=new_post.published_at,
@@ -84,307 +225,373 @@ async def create_post(
         )
     
     # Pubblica su ogni piattaforma
-    results = []
-    success_count = 0
-    
-    for token in user_tokens:
-        if token.platform in post_data.platforms:
-            try:
-                result = await publish_to_platform(
-                    token.platform,
-                    token.access_token,
-                    post_data.content,
-                    post_data.media_urls or []
-                )
-                
-                # Salva il risultato nel database
-                post_result = PostResult(
-                    post_id=new_post.id,
-                    platform=token.platform,
-                    platform_post_id=result.get("post_id"),
-                    status="success",
-                    published_at=datetime.utcnow()
-                )
-                
-                db.add(post_result)
-                success_count += 1
-                results.append({
-                    "platform": token.platform,
-                    "status": "success",
-                    "post_id": result.get("post_id")
-                })
-                
-            except Exception as e:
-                # Salva l'errore nel database
-                post_result = PostResult(
-                    post_id=new_post.id,
-                    platform=token.platform,
-                    status="failed",
-                    error_message=str(e)
-                )
-                
-                db.add(post_result)
-                results.append({
-                    "platform": token.platform,
-                    "status": "failed",
-                    "error": str(e)
-                })
-    
-    # Aggiorna lo status del post
-    if success_count == len(post_data.platforms):
-        new_post.status = "published"
-    elif success_count > 0:
-        new_post.status = "partially_published"
-    else:
-        new_post.status = "failed"
+    tokens_by_platform = {platform: accounts[platform] for platform in dict.fromkeys(post_data.platforms)}
+    outcomes = await publish_to_platforms(
+        http_client,
+        list(tokens_by_platform.values()),
+        post_data.content,
+        post_data.media_urls or []
+    )
+    
+    results = await save_publish_outcomes(db, new_post, tokens_by_platform, outcomes)
+    success_count = sum(1 for outcome in outcomes.values() if outcome["status"] == "success")
+    
+    # Le piattaforme oltre il rate limit o con il circuito aperto vengono riprogrammate come job
+    deferred = {platform: outcome for platform, outcome in outcomes.items() if outcome.get("retry_at")}
+    for platform, outcome in deferred.items():
+        enqueue_publish_jobs(db, new_post, [platform], available_at=outcome["retry_at"])
     
-    new_post.published_at = datetime.utcnow()
-    db.commit()
+    # Aggiorna lo status del post (con job in sospeso lo completano i worker)
+    if deferred:
+        new_post.status = "queued"
+    else:
+        new_post.status = compute_post_status(success_count, len(set(post_data.platforms)))
+        new_post.published_at = datetime.utcnow()
+    await bump_data_version(db, current_user.id)
+    await db.commit()
     
     return PostResponse(
         id=new_post.id,
         content=new_post.content,
-        platforms=json.loads(new_post.platforms),
+        platforms=platforms,
         status=new_post.status,
         created_at=new_post.created_at,
         published_at=new_post.published_at,
         results=results
     )
 
-async def publish_to_platform(platform: str, access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
-    """Pubblica contenuto su una specifica piattaforma social"""
-    
-    if platform == "facebook":
-        return await publish_to_facebook(access_token, content, media_urls)
-    elif platform == "instagram":
-        return await publish_to_instagram(access_token, content, media_urls)
-    elif platform == "linkedin":
-        return await publish_to_linkedin(access_token, content, media_urls)
-    elif platform == "twitter":
-        return await publish_to_twitter(access_token, content, media_urls)
-    elif platform == "tiktok":
-        return await publish_to_tiktok(access_token, content, media_urls)
-    else:
-        raise ValueError(f"Unsupported platform: {platform}")
+@router.post(
+    "/bulk",
+    response_model=BulkPostResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    responses={status.HTTP_422_UNPROCESSABLE_ENTITY: {"model": BulkPostResponse, "description": "Nessun post accettato"}}
+)
+async def create_posts_bulk(
+    bulk_data: BulkPostCreate,
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Crea un batch di post in un'unica transazione.
 
-async def publish_to_facebook(access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
-    """Pubblica su Facebook"""
-    
-    # Prima ottieni l'ID della pagina Facebook
-    async with httpx.AsyncClient() as client:
-        # Ottieni le pagine dell'utente
-        pages_response = await client.get(
-            "https://graph.facebook.com/me/accounts",
-            params={"access_token": access_token}
-        )
-        pages_response.raise_for_status()
-        pages_data = pages_response.json()
-        
-        if not pages_data.get("data"):
-            raise Exception("No Facebook pages found")
-        
-        # Usa la prima pagina disponibile
-        page = pages_data["data"][0]
-        page_id = page["id"]
-        page_access_token = page["access_token"]
+    I post immediati vengono sempre accodati ai worker di pubblicazione (come con PUBLISH_MODE=queue),
+    quelli programmati passano allo scheduler. I post non validi per le piattaforme o con connessioni
+    mancanti vengono scartati singolarmente senza bloccare il resto del batch.
+
+    Risponde 202 se almeno un post è stato accettato, 422 con gli esiti per elemento se sono stati
+    scartati tutti.
+    """
+    
+    # Le connessioni dell'utente vengono verificate una sola volta per tutto il batch
+    accounts = await get_connected_accounts(db, current_user.id)
+    requested_platforms = {platform for post_data in bulk_data.posts for platform in post_data.platforms}
+    if requested_platforms - set(accounts):
+        accounts = await load_connected_accounts(db, current_user.id)
+    
+    now = datetime.utcnow()
+    results: List[Optional[BulkPostItemResult]] = [None] * len(bulk_data.posts)
+    rows = []
+    row_indexes = []
+    
+    for index, post_data in enumerate(bulk_data.posts):
+        errors = validate_post(post_data.platforms, post_data.content, post_data.media_urls or [])
+        if errors:
+            results[index] = BulkPostItemResult(
+                index=index,
+                status="rejected",
+                error="; ".join(errors)
+            )
+            continue
         
-        # Pubblica il post
-        post_data = {
-            "message": content,
-            "access_token": page_access_token
-        }
+        missing_platforms = set(post_data.platforms) - set(accounts)
+        if missing_platforms:
+            results[index] = BulkPostItemResult(
+                index=index,
+                status="rejected",
+                error=f"Missing connections for platforms: {', '.join(missing_platforms)}"
+            )
+            continue
         
-        # Se ci sono media, aggiungi il primo
-        if media_urls:
-            post_data["link"] = media_urls[0]
+        expired_platforms = [platform for platform in dict.fromkeys(post_data.platforms) if accounts[platform].needs_reconnect()]
+        if expired_platforms:
+            results[index] = BulkPostItemResult(
+                index=index,
+                status="rejected",
+                error=f"Reconnect required for platforms: {', '.join(expired_platforms)}"
+            )
+            continue
         
-        response = await client.post(
-            f"https://graph.facebook.com/{page_id}/feed",
-            data=post_data
-        )
-        response.raise_for_status()
-        result = response.json()
+        scheduled_at = as_utc_naive(post_data.scheduled_at) if post_data.scheduled_at else None
+        rows.append({
+            "user_id": current_user.id,
+            "content": post_data.content,
+            "media_urls": json.dumps(post_data.media_urls) if post_data.media_urls else None,
+            "platforms": json.dumps(post_data.platforms),
+            "status": "scheduled" if scheduled_at and scheduled_at > now else "queued",
+            "scheduled_at": scheduled_at
+        })
+        row_indexes.append(index)
+    
+    posts = []
+    if rows:
+        # INSERT multiplo con RETURNING, nello stesso ordine dei parametri
+        post_ids = (await db.scalars(insert(Post).returning(Post.id, sort_by_parameter_order=True), rows)).all()
+        await insert_post_children(db, [
+            (post_id, bulk_data.posts[index].platforms, bulk_data.posts[index].media_urls or [])
+            for index, post_id in zip(row_indexes, post_ids)
+        ])
         
-        return {"post_id": result.get("id")}
-
-async def publish_to_instagram(access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
-    """Pubblica su Instagram"""
-    
-    async with httpx.AsyncClient() as client:
-        # Ottieni l'account Instagram Business collegato
-        accounts_response = await client.get(
-            "https://graph.facebook.com/me/accounts",
-            params={
-                "fields": "instagram_business_account",
-                "access_token": access_token
-            }
-        )
-        accounts_response.raise_for_status()
-        accounts_data = accounts_response.json()
+        # Post riletti con le piattaforme appena inserite in post_targets (una query IN (...) in più)
+        posts_by_id = {post.id: post for post in (await db.scalars(
+            select(Post).options(selectinload(Post.targets)).filter(Post.id.in_(post_ids))
+        )).all()}
+        posts = [posts_by_id[post_id] for post_id in post_ids]
         
-        instagram_account_id = None
-        for page in accounts_data.get("data", []):
-            if page.get("instagram_business_account"):
-                instagram_account_id = page["instagram_business_account"]["id"]
-                break
+        for post in posts:
+            if post.status == "queued":
+                enqueue_publish_jobs(db, post, post_platforms(post))
         
-        if not instagram_account_id:
-            raise Exception("No Instagram Business account found")
+        await bump_data_version(db, current_user.id)
+        await db.commit()
         
-        # Per Instagram, è necessario prima caricare il media, poi pubblicare
-        # Questo è un esempio semplificato per post di testo
-        if media_urls:
-            # Crea un container per il media
-            container_data = {
-                "image_url": media_urls[0],
-                "caption": content,
-                "access_token": access_token
-            }
-            
-            container_response = await client.post(
-                f"https://graph.facebook.com/{instagram_account_id}/media",
-                data=container_data
-            )
-            container_response.raise_for_status()
-            container_result = container_response.json()
-            
-            # Pubblica il container
-            publish_data = {
-                "creation_id": container_result["id"],
-                "access_token": access_token
-            }
-            
-            publish_response = await client.post(
-                f"https://graph.facebook.com/{instagram_account_id}/media_publish",
-                data=publish_data
+        for post in posts:
+            if post.status == "scheduled":
+                scheduler.schedule(post.id, post.scheduled_at)
+        worker_pool.notify()
+    
+    for index, post in zip(row_indexes, posts):
+        results[index] = BulkPostItemResult(
+            index=index,
+            status="created",
+            post=PostResponse(
+                id=post.id,
+                content=post.content,
+                platforms=post_platforms(post),
+                status=post.status,
+                created_at=post.created_at,
+                published_at=post.published_at,
+                results=[]
             )
-            publish_response.raise_for_status()
-            publish_result = publish_response.json()
-            
-            return {"post_id": publish_result.get("id")}
-        else:
-            raise Exception("Instagram requires media content")
-
-async def publish_to_linkedin(access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
-    """Pubblica su LinkedIn"""
-    
-    async with httpx.AsyncClient() as client:
-        # Ottieni l'ID del profilo
-        profile_response = await client.get(
-            "https://api.linkedin.com/v2/people/~",
-            headers={"Authorization": f"Bearer {access_token}"}
         )
-        profile_response.raise_for_status()
-        profile_data = profile_response.json()
-        profile_id = profile_data["id"]
-        
-        # Prepara il post
-        post_data = {
-            "author": f"urn:li:person:{profile_id}",
-            "lifecycleState": "PUBLISHED",
-            "specificContent": {
-                "com.linkedin.ugc.ShareContent": {
-                    "shareCommentary": {
-                        "text": content
-                    },
-                    "shareMediaCategory": "NONE"
+    
+    # Nessun post accettato: niente è stato accodato, il 202 sarebbe fuorviante
+    if not posts:
+        response.status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    
+    return BulkPostResponse(
+        created=len(posts),
+        rejected=len(bulk_data.posts) - len(posts),
+        results=results
+    )
+
+# Il corpo non è dichiarato come parametro (UploadFile) per non farlo leggere a Starlette prima
+# della rotta: lo schema multipart viene quindi descritto a mano per la documentazione OpenAPI
+MEDIA_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}}
                 }
-            },
-            "visibility": {
-                "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
             }
         }
-        
-        # Se ci sono media, aggiungi il link
-        if media_urls:
-            post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["shareMediaCategory"] = "ARTICLE"
-            post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["media"] = [{
-                "status": "READY",
-                "originalUrl": media_urls[0]
-            }]
-        
-        response = await client.post(
-            "https://api.linkedin.com/v2/ugcPosts",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            },
-            json=post_data
+    }
+}
+
+@router.post("/media", response_model=MediaUploadResponse, status_code=status.HTTP_201_CREATED, openapi_extra=MEDIA_UPLOAD_OPENAPI)
+async def upload_media(
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """Carica un'immagine o un video e restituisce l'URL da usare in media_urls.
+
+    Sono accettati solo JPEG, PNG, GIF, WebP, MP4 e QuickTime, verificati sul contenuto del file.
+    Il corpo multipart viene letto in streaming: un file troppo grande viene rifiutato dal
+    Content-Length dichiarato o appena supera il limite, senza essere salvato per intero.
+    """
+    
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MEDIA_MAX_BODY_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the maximum size of {MEDIA_MAX_BYTES} bytes"
         )
-        response.raise_for_status()
-        result = response.json()
-        
-        return {"post_id": result.get("id")}
+    
+    try:
+        stored = await store_upload_stream(request.headers.get("content-type", ""), request.stream())
+    except MediaTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except MediaTypeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
+        )
+    except MediaUploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return MediaUploadResponse(**stored._asdict())
+
+@router.get("/stats", response_model=PublishStatsResponse)
+async def get_publish_stats(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    platform: Optional[str] = None
+):
+    """Statistiche giornaliere di pubblicazione per piattaforma (successi, errori, latenza).
 
-async def publish_to_twitter(access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
-    """Pubblica su Twitter/X"""
+    Legge solo il rollup publish_stats_daily: il costo dipende dai giorni richiesti, non dal
+    numero di post dell'utente.
+    """
     
-    async with httpx.AsyncClient() as client:
-        post_data = {"text": content}
-        
-        # Twitter ha un limite di caratteri, tronca se necessario
-        if len(content) > 280:
-            post_data["text"] = content[:277] + "..."
-        
-        response = await client.post(
-            "https://api.twitter.com/2/tweets",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            },
-            json=post_data
+    to_date = to_date or datetime.utcnow().date()
+    from_date = from_date or to_date - timedelta(days=STATS_DEFAULT_DAYS - 1)
+    if from_date > to_date or (to_date - from_date).days >= STATS_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid date range: from_date must precede to_date by at most {STATS_MAX_DAYS} days"
         )
-        response.raise_for_status()
-        result = response.json()
-        
-        return {"post_id": result["data"]["id"]}
+    
+    query = select(PublishStatsDaily).filter(
+        PublishStatsDaily.user_id == current_user.id,
+        PublishStatsDaily.day >= from_date,
+        PublishStatsDaily.day <= to_date
+    )
+    if platform:
+        query = query.filter(PublishStatsDaily.platform == platform)
+    rows = (await db.scalars(query.order_by(PublishStatsDaily.day, PublishStatsDaily.platform))).all()
+    
+    # Totali per piattaforma sommati dalle righe giornaliere già lette
+    totals: Dict[str, List[int]] = {}
+    for row in rows:
+        total = totals.setdefault(row.platform, [0, 0, 0, 0, 0])
+        total[0] += row.success_count
+        total[1] += row.failure_count
+        total[2] += row.latency_count
+        total[3] += row.latency_ms_total
+        total[4] = max(total[4], row.latency_ms_max)
+    
+    return PublishStatsResponse(
+        from_date=from_date,
+        to_date=to_date,
+        days=[
+            build_stats_item(row.platform, row.day, row.success_count, row.failure_count,
+                             row.latency_count, row.latency_ms_total, row.latency_ms_max)
+            for row in rows
+        ],
+        totals=[build_stats_item(name, None, *total) for name, total in sorted(totals.items())]
+    )
 
-async def publish_to_tiktok(access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
-    """Pubblica su TikTok"""
-    
-    # TikTok richiede video, non supporta post di solo testo
-    if not media_urls:
-        raise Exception("TikTok requires video content")
-    
-    async with httpx.AsyncClient() as client:
-        # Questo è un esempio semplificato
-        # TikTok API richiede un processo più complesso per il caricamento video
-        post_data = {
-            "video_url": media_urls[0],
-            "text": content,
-            "privacy_level": "PUBLIC_TO_EVERYONE"
-        }
-        
-        response = await client.post(
-            "https://open-api.tiktok.com/share/video/upload/",
-            headers={"Authorization": f"Bearer {access_token}"},
-            json=post_data
+@router.get("/{post_id}/status", response_model=PostStatusResponse)
+async def get_post_status(
+    post_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Riporta lo stato di pubblicazione di un post e l'esito per ogni piattaforma"""
+    
+    post = await db.scalar(select(Post).options(selectinload(Post.targets)).filter(
+        Post.id == post_id,
+        Post.user_id == current_user.id
+    ))
+    
+    if not post:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Post not found"
         )
-        response.raise_for_status()
-        result = response.json()
-        
-        return {"post_id": result.get("share_id")}
+    
+    pending_platforms = (await db.scalars(select(PublishJob.platform).filter(
+        PublishJob.post_id == post.id,
+        PublishJob.status.in_(("queued", "running"))
+    ))).all()
+    
+    post_results = (await db.scalars(select(PostResult).filter(PostResult.post_id == post.id))).all()
+    
+    return PostStatusResponse(
+        id=post.id,
+        status=post.status,
+        platforms=post_platforms(post),
+        pending_platforms=list(pending_platforms),
+        results=[{
+            "platform": pr.platform,
+            "status": pr.status,
+            "post_id": pr.platform_post_id,
+            "error": pr.error_message,
+            "published_at": pr.published_at
+        } for pr in post_results]
+    )
 
-@router.get("/history")
+@router.get("/history", response_model=List[PostResponse])
 async def get_post_history(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    limit: int = 20,
-    offset: int = 0
+    request: Request,
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    platform: Optional[str] = None,
+    offset: Optional[int] = Query(None, include_in_schema=False),
+    if_none_match: Optional[str] = Header(None)
 ):
-    """Ottiene la cronologia dei post dell'utente"""
+    """Ottiene la cronologia dei post dell'utente, paginata con un cursore e filtrabile per piattaforma.
+
+    Il corpo resta la lista dei post; il cursore della pagina successiva è negli header
+    X-Next-Cursor e Link (rel="next"), assenti sull'ultima pagina.
+
+    Risponde 304 se l'ETag inviato in If-None-Match corrisponde alla versione corrente dei dati,
+    senza leggere le tabelle posts e post_results.
+    """
+    
+    # La paginazione con offset non è più supportata: ignorarla restituirebbe di nuovo la prima pagina
+    if offset:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The offset parameter is no longer supported: use the cursor from the X-Next-Cursor header"
+        )
+    
+    # La versione viene letta prima dei dati: una scrittura concorrente produce al più un ETag già superato
+    etag = make_etag("posts/history", current_user.id, await get_data_version(db, current_user.id), limit, cursor, platform)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
     
-    posts = db.query(Post).filter(
+    # Risultati e piattaforme di tutti i post della pagina vengono caricati con una query IN (...) ciascuno
+    query = select(Post).options(selectinload(Post.results), selectinload(Post.targets)).filter(
         Post.user_id == current_user.id
-    ).order_by(Post.created_at.desc()).offset(offset).limit(limit).all()
+    )
+    
+    # Il filtro per piattaforma è un EXISTS su post_targets, senza decodificare il JSON dei post
+    if platform:
+        query = query.filter(Post.targets.any(PostTarget.platform == platform))
+    
+    # Paginazione a cursore: riparte dall'ultimo post restituito usando l'indice
+    # (user_id, created_at, id), quindi ogni pagina costa come la prima
+    if cursor:
+        cursor_created_at, cursor_id = decode_history_cursor(cursor)
+        query = query.filter(or_(
+            Post.created_at < cursor_created_at,
+            and_(Post.created_at == cursor_created_at, Post.id < cursor_id)
+        ))
+    
+    # Un elemento in più indica se esiste una pagina successiva
+    posts = (await db.scalars(query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1))).all()
+    next_cursor = encode_history_cursor(posts[limit - 1]) if len(posts) > limit else None
+    posts = posts[:limit]
     
     result = []
     for post in posts:
-        # Ottieni i risultati per questo post
-        post_results = db.query(PostResult).filter(PostResult.post_id == post.id).all()
-        
         results = []
-        for pr in post_results:
+        for pr in post.results:
             results.append({
                 "platform": pr.platform,
                 "status": pr.status,
@@ -396,12 +603,17 @@ async def get_post_history(
         result.append(PostResponse(
             id=post.id,
             content=post.content,
-            platforms=json.loads(post.platforms),
+            platforms=post_platforms(post),
             status=post.status,
             created_at=post.created_at,
             published_at=post.published_at,
             results=results
         ))
     
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
     return result
 
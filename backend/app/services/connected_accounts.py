@@ -0,0 +1,141 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel
+from typing import Dict, NamedTuple, Optional
+from datetime import datetime, timezone
+import os
+import sys
+from dotenv import load_dotenv
+
+from models.models import SocialToken
+from services.data_version import get_data_version
+from utils.cache import TTLCache
+
+load_dotenv()
+
+# Cache per utente degli account social attivi: la memoria occupata è limitata da CONNECTED_ACCOUNTS_CACHE_MAX_BYTES
+CONNECTED_ACCOUNTS_CACHE_TTL = float(os.getenv("CONNECTED_ACCOUNTS_CACHE_TTL", "300"))
+CONNECTED_ACCOUNTS_CACHE_SIZE = int(os.getenv("CONNECTED_ACCOUNTS_CACHE_SIZE", "100000"))
+CONNECTED_ACCOUNTS_CACHE_MAX_BYTES = int(os.getenv("CONNECTED_ACCOUNTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+class ConnectedAccount(BaseModel):
+    """Copia in sola lettura di un SocialToken attivo, sicura da condividere tra richieste"""
+    id: int
+    user_id: int
+    platform: str
+    access_token: str
+    refresh_token: Optional[str] = None
+    token_type: Optional[str] = None
+    expires_at: Optional[datetime] = None
+    platform_user_id: Optional[str] = None
+    platform_username: Optional[str] = None
+    is_active: bool = True
+    refresh_failed_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
+    def needs_reconnect(self, now: Optional[datetime] = None) -> bool:
+        """Token scaduto o di cui la piattaforma ha rifiutato il refresh: non è utilizzabile"""
+        if self.refresh_failed_at is not None:
+            return True
+        if self.expires_at is None:
+            return False
+        expires_at = self.expires_at
+        if expires_at.tzinfo is not None:
+            expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return expires_at <= (now or datetime.utcnow())
+
+class CachedAccounts(NamedTuple):
+    """Voce della cache: gli account e la versione dei dati dell'utente letta prima di caricarli"""
+    version: int
+    accounts: Dict[str, ConnectedAccount]
+
+def estimate_accounts_size(entry: CachedAccounts) -> int:
+    """Stima in byte la memoria occupata dagli account di un utente"""
+    size = sys.getsizeof(entry) + sys.getsizeof(entry.accounts)
+    for platform, account in entry.accounts.items():
+        size += sys.getsizeof(platform) + sys.getsizeof(account) + sys.getsizeof(account.__dict__)
+        size += sum(sys.getsizeof(value) for value in account.__dict__.values())
+    return size
+
+connected_accounts_cache = TTLCache(
+    ttl=CONNECTED_ACCOUNTS_CACHE_TTL,
+    maxsize=CONNECTED_ACCOUNTS_CACHE_SIZE,
+    max_bytes=CONNECTED_ACCOUNTS_CACHE_MAX_BYTES,
+    weigh=estimate_accounts_size
+)
+
+async def load_connected_accounts(db: AsyncSession, user_id: int, version: Optional[int] = None) -> Dict[str, ConnectedAccount]:
+    """Legge dal database gli account attivi di un utente e aggiorna la cache.
+
+    La versione dei dati va letta prima dei token: una scrittura concorrente lascia in cache
+    al più una versione già superata, che forza una nuova lettura.
+    """
+    if version is None:
+        version = await get_data_version(db, user_id)
+    tokens = (await db.scalars(select(SocialToken).filter(
+        SocialToken.user_id == user_id,
+        SocialToken.is_active == True
+    ))).all()
+
+    accounts = {token.platform: ConnectedAccount.model_validate(token) for token in tokens}
+    connected_accounts_cache.set(user_id, CachedAccounts(version, accounts))
+    return accounts
+
+async def get_connected_accounts(db: AsyncSession, user_id: int, version: Optional[int] = None) -> Dict[str, ConnectedAccount]:
+    """Account social attivi di un utente per piattaforma, dalla cache quando disponibili.
+
+    La cache è locale al processo: la voce vale solo finché users.data_version non cambia, così
+    connessioni, disconnessioni e refresh fatti da altri processi sono visti subito. Il controllo
+    costa una lettura per chiave primaria (evitata se il chiamante ha già letto la versione).
+    """
+    if version is None:
+        version = await get_data_version(db, user_id)
+    cached = connected_accounts_cache.get(user_id)
+    if cached is not None and cached.version == version:
+        return cached.accounts
+    return await load_connected_accounts(db, user_id, version)
+
+def _replace_cached_accounts(user_id: int, cached: CachedAccounts, accounts: Dict[str, ConnectedAccount]) -> None:
+    # La versione resta quella letta con i token: la scrittura in corso la incrementa sul database,
+    # quindi la prossima lettura ricarica comunque gli account dopo il commit
+    connected_accounts_cache.set(user_id, cached._replace(accounts=accounts))
+
+def store_connected_account(token: SocialToken) -> None:
+    """Aggiorna in cache l'account di un utente dopo una connessione o un refresh del token.
+
+    Se l'utente non è in cache non serve fare nulla: la prossima lettura carica tutti i suoi account.
+    """
+    cached = connected_accounts_cache.get(token.user_id)
+    if cached is None:
+        return
+
+    # Il dizionario in cache non viene mai modificato: chi lo sta leggendo non vede stati intermedi
+    accounts = dict(cached.accounts)
+    if token.is_active:
+        accounts[token.platform] = ConnectedAccount.model_validate(token)
+    else:
+        accounts.pop(token.platform, None)
+    _replace_cached_accounts(token.user_id, cached, accounts)
+
+def remove_connected_account(user_id: int, platform: str) -> None:
+    """Rimuove dalla cache l'account disconnesso di un utente"""
+    cached = connected_accounts_cache.get(user_id)
+    if cached is None or platform not in cached.accounts:
+        return
+
+    accounts = {key: value for key, value in cached.accounts.items() if key != platform}
+    _replace_cached_accounts(user_id, cached, accounts)
+
+def update_connected_account(user_id: int, platform: str, **changes) -> None:
+    """Applica alla copia in cache le modifiche salvate su un account (es. platform_user_id)"""
+    cached = connected_accounts_cache.get(user_id)
+    if cached is None or platform not in cached.accounts:
+        return
+
+    accounts = dict(cached.accounts)
+    accounts[platform] = accounts[platform].model_copy(update=changes)
+    _replace_cached_accounts(user_id, cached, accounts)
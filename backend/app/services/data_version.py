@@ -0,0 +1,39 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Iterable, Optional
+import hashlib
+
+from models.models import User
+
+async def bump_data_version(db: AsyncSession, *user_ids: int) -> None:
+    """Incrementa la versione dei dati degli utenti (senza commit), nella stessa transazione della scrittura.
+
+    Va chiamata da ogni transazione che modifica post, risultati o token di un utente: gli ETag
+    di /posts/history e /social/tokens sono derivati da questa versione.
+    """
+    user_ids = set(user_ids)
+    if user_ids:
+        await db.execute(update(User).filter(User.id.in_(user_ids)).values(data_version=User.data_version + 1))
+
+async def get_data_version(db: AsyncSession, user_id: int) -> int:
+    """Versione corrente dei dati dell'utente: una lettura per chiave primaria sulla tabella users"""
+    return await db.scalar(select(User.data_version).filter(User.id == user_id)) or 0
+
+def make_etag(resource: str, user_id: int, version: int, *params: object) -> str:
+    """ETag debole per una risorsa dell'utente; i parametri della richiesta (cursore, filtri) entrano nell'hash"""
+    digest = hashlib.sha256(repr((resource, user_id, version, params)).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Confronto debole di If-None-Match con l'ETag corrente (RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(candidate) for candidate in _split(if_none_match)}
+
+def _split(header: str) -> Iterable[str]:
+    return (value.strip() for value in header.split(",") if value.strip())
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
@@ -0,0 +1,257 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+
+from db.database import AsyncSessionLocal
+from models.models import Post, PostResult, PublishJob
+from services.connected_accounts import get_connected_accounts
+from services.data_version import bump_data_version
+from services.post_targets import post_media_urls, post_platforms
+from services.publish_stats import record_post_results
+from services.publisher import PUBLISH_MAX_DEFERRALS, publish_to_platforms, save_publish_outcomes, compute_post_status
+from utils.http_client import get_http_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Modalità di pubblicazione di /posts/create: "inline" (attende le piattaforme) o "queue" (risponde 202)
+PUBLISH_MODE = os.getenv("PUBLISH_MODE", "inline").lower()
+# Numero di worker asyncio che consumano la coda (0 per disattivarli in questo processo)
+PUBLISH_WORKERS = int(os.getenv("PUBLISH_WORKERS", "4"))
+# Intervallo di polling della coda quando non arrivano notifiche dallo stesso processo (secondi)
+PUBLISH_POLL_INTERVAL = float(os.getenv("PUBLISH_POLL_INTERVAL", "2"))
+# Dopo quanto un job rimasto "running" (worker terminato) torna in coda (secondi)
+PUBLISH_JOB_LEASE = float(os.getenv("PUBLISH_JOB_LEASE", "300"))
+# Ogni quanto il pool cerca i job con il lease scaduto (secondi)
+PUBLISH_RECOVERY_INTERVAL = float(os.getenv("PUBLISH_RECOVERY_INTERVAL", "60"))
+
+def enqueue_publish_jobs(db: AsyncSession, post: Post, platforms: List[str], available_at: Optional[datetime] = None) -> List[PublishJob]:
+    """Crea un job di pubblicazione per ogni piattaforma del post (senza commit)"""
+    available_at = available_at or datetime.utcnow()
+    jobs = [
+        PublishJob(post_id=post.id, platform=platform, status="queued", available_at=available_at)
+        for platform in dict.fromkeys(platforms)
+    ]
+    db.add_all(jobs)
+    return jobs
+
+async def claim_next_job(db: AsyncSession) -> Optional[int]:
+    """Preleva il prossimo job pronto e lo marca come in esecuzione.
+
+    L'UPDATE condizionato sullo status rende il prelievo atomico anche con più processi
+    che leggono la stessa coda: se un altro worker ha già preso il job si passa al successivo.
+    """
+    while True:
+        now = datetime.utcnow()
+        job_id = await db.scalar(select(PublishJob.id).filter(
+            PublishJob.status == "queued",
+            PublishJob.available_at <= now
+        ).order_by(PublishJob.available_at, PublishJob.id).limit(1))
+
+        if job_id is None:
+            return None
+
+        claimed = await db.execute(update(PublishJob).filter(
+            PublishJob.id == job_id,
+            PublishJob.status == "queued"
+        ).values(
+            status="running",
+            locked_at=now,
+            attempts=PublishJob.attempts + 1
+        ))
+        await db.commit()
+
+        if claimed.rowcount:
+            return job_id
+
+async def recover_stale_jobs(db: AsyncSession) -> int:
+    """Rimette in coda i job rimasti in esecuzione oltre il lease (es. worker terminato)"""
+    cutoff = datetime.utcnow() - timedelta(seconds=PUBLISH_JOB_LEASE)
+    recovered = await db.execute(update(PublishJob).filter(
+        PublishJob.status == "running",
+        PublishJob.locked_at < cutoff
+    ).values(status="queued", locked_at=None))
+    await db.commit()
+    return recovered.rowcount
+
+async def load_post(db: AsyncSession, post_id: int) -> Optional[Post]:
+    """Post di un job con piattaforme e media già caricati (niente lazy load in una sessione asincrona)"""
+    return await db.get(
+        Post,
+        post_id,
+        options=[selectinload(Post.targets), selectinload(Post.media)],
+        populate_existing=True
+    )
+
+async def finalize_post(db: AsyncSession, post: Post) -> None:
+    """Aggiorna lo status del post quando tutti i suoi job sono terminati"""
+    pending = await db.scalar(select(PublishJob.id).filter(
+        PublishJob.post_id == post.id,
+        PublishJob.status.in_(("queued", "running"))
+    ).limit(1))
+    if pending:
+        return
+
+    success_count = await db.scalar(select(func.count(PostResult.id)).filter(
+        PostResult.post_id == post.id,
+        PostResult.status == "success"
+    ))
+
+    post.status = compute_post_status(success_count, len(post_platforms(post)))
+    post.published_at = datetime.utcnow()
+    await bump_data_version(db, post.user_id)
+    await db.commit()
+
+async def run_publish_job(job_id: int) -> None:
+    """Esegue un job di pubblicazione e ne salva l'esito in PostResult"""
+    async with AsyncSessionLocal() as db:
+        try:
+            job = await db.get(PublishJob, job_id)
+            post = await load_post(db, job.post_id)
+
+            token = (await get_connected_accounts(db, post.user_id)).get(job.platform)
+
+            if token is None:
+                outcomes = {job.platform: {"status": "failed", "error": f"Missing connection for platform: {job.platform}"}}
+            elif token.needs_reconnect():
+                outcomes = {job.platform: {"status": "failed", "error": f"Reconnect required for platform: {job.platform}"}}
+            else:
+                outcomes = await publish_to_platforms(
+                    get_http_client(),
+                    [token],
+                    post.content,
+                    post_media_urls(post)
+                )
+
+            await save_publish_outcomes(db, post, {job.platform: token} if token else {}, outcomes)
+
+            outcome = outcomes[job.platform]
+            job.last_error = outcome.get("error")
+            
+            # Limite raggiunto o piattaforma non disponibile: il job torna in coda senza fallire
+            # (i rinvii per indisponibilità sono limitati, quelli per rate limit no)
+            if outcome.get("retry_at") and (outcome["status"] == "rate_limited" or job.attempts < PUBLISH_MAX_DEFERRALS):
+                job.status = "queued"
+                job.available_at = outcome["retry_at"]
+                job.locked_at = None
+                await db.commit()
+                logger.info("Publish job %s deferred (%s), retrying at %s", job_id, outcome["status"], outcome["retry_at"])
+                return
+            
+            if outcome.get("retry_at"):
+                # Troppi rinvii: l'esito viene salvato come errore
+                await record_post_results(db, post.user_id, [PostResult(
+                    post_id=post.id, platform=job.platform, status="failed", error_message=outcome["error"]
+                )])
+            
+            job.status = "done" if outcome["status"] == "success" else "failed"
+            await db.commit()
+
+        except Exception as e:
+            logger.exception("Publish job %s failed unexpectedly", job_id)
+            await db.rollback()
+            job = await db.get(PublishJob, job_id)
+            # Job già concluso (o rimesso in coda) prima dell'errore: l'esito è già registrato
+            if job is None or job.status != "running":
+                return
+            post = await load_post(db, job.post_id)
+            job.status = "failed"
+            job.last_error = str(e)
+            if post is not None:
+                await record_post_results(db, post.user_id, [PostResult(
+                    post_id=job.post_id, platform=job.platform, status="failed", error_message=str(e)
+                )])
+            await db.commit()
+            if post is None:
+                return
+
+        # Fuori dal try: un errore qui non deve trasformare in "failed" un job già concluso
+        await finalize_post(db, post)
+
+class PublishWorkerPool:
+    """Pool di worker asyncio che consuma la coda dei job di pubblicazione salvata su database"""
+
+    def __init__(self, size: int, poll_interval: float, recovery_interval: float):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.recovery_interval = recovery_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        if self._tasks or self.size <= 0:
+            return
+
+        self._wakeup = asyncio.Event()
+
+        await self._recover()
+
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.size)]
+        self._tasks.append(asyncio.create_task(self._recover_loop()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Sveglia i worker in attesa dopo l'inserimento di nuovi job"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _recover(self) -> None:
+        """Rimette in coda i job con il lease scaduto e sveglia i worker"""
+        try:
+            async with AsyncSessionLocal() as db:
+                recovered = await recover_stale_jobs(db)
+        except Exception:
+            logger.exception("Failed to recover stale publish jobs")
+            return
+
+        if recovered:
+            logger.info("Requeued %d stale publish jobs", recovered)
+            self.notify()
+
+    async def _recover_loop(self) -> None:
+        """Recupera periodicamente i job lasciati "running" da un worker terminato o cancellato"""
+        while True:
+            await asyncio.sleep(self.recovery_interval)
+            await self._recover()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    job_id = await claim_next_job(db)
+            except Exception:
+                logger.exception("Failed to claim publish job")
+                job_id = None
+
+            if job_id is None:
+                # Coda vuota: attende una notifica o il successivo intervallo di polling
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            # Un errore non gestito terminerebbe il worker e ridurrebbe la capacità del pool
+            try:
+                await run_publish_job(job_id)
+            except Exception:
+                logger.exception("Publish job %s crashed the worker", job_id)
+
+worker_pool = PublishWorkerPool(
+    size=PUBLISH_WORKERS,
+    poll_interval=PUBLISH_POLL_INTERVAL,
+    recovery_interval=PUBLISH_RECOVERY_INTERVAL
+)
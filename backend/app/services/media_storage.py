@@ -0,0 +1,239 @@
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, BinaryIO, Dict, List, NamedTuple, Optional
+import hashlib
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directory dei file caricati, servita dall'applicazione sotto /media
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "./media")
+# Directory dei file in caricamento: fuori da MEDIA_ROOT, che è pubblica, ma sullo stesso
+# filesystem perché il file completo viene spostato con una rinomina atomica
+MEDIA_TEMP_DIR = os.getenv("MEDIA_TEMP_DIR", MEDIA_ROOT.rstrip("/\\") + ".tmp")
+# URL pubblico di MEDIA_ROOT: deve essere raggiungibile dalle piattaforme social che scaricano i media
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "http://localhost:8000/media").rstrip("/")
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Byte del corpo multipart oltre al file (intestazioni delle parti, altri campi)
+MEDIA_MULTIPART_OVERHEAD = int(os.getenv("MEDIA_MULTIPART_OVERHEAD", str(64 * 1024)))
+MEDIA_MAX_BODY_BYTES = MEDIA_MAX_BYTES + MEDIA_MULTIPART_OVERHEAD
+# Dimensione dei blocchi scritti su disco: la memoria usata non dipende dalla dimensione del file
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024)))
+# Byte iniziali necessari a riconoscere il formato
+SNIFF_BYTES = 16
+# Formati accettati e relativa estensione. I file sono serviti dall'origine dell'API: formati
+# interpretabili dal browser come documenti (SVG, HTML) permetterebbero XSS memorizzato
+MEDIA_ALLOWED_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "video/mp4": ".mp4",
+    "video/quicktime": ".mov",
+}
+# Brand ISO BMFF di immagini (HEIC/AVIF), che condividono il contenitore con MP4
+IMAGE_FTYP_BRANDS = (b"heic", b"heix", b"mif1", b"msf1", b"avif", b"avis")
+
+class MediaTooLargeError(Exception):
+    pass
+
+class MediaTypeError(Exception):
+    pass
+
+class MediaUploadError(Exception):
+    """Corpo della richiesta non valido (non multipart, troncato o senza il campo file)"""
+    pass
+
+class StoredMedia(NamedTuple):
+    url: str
+    sha256: str
+    size: int
+    content_type: str
+    deduplicated: bool
+
+def sniff_media_type(head: bytes) -> Optional[str]:
+    """Tipo del file dalla firma nei primi byte, None se non è uno dei formati accettati"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        if head[8:12] in IMAGE_FTYP_BRANDS:
+            return None
+        return "video/quicktime" if head[8:12] == b"qt  " else "video/mp4"
+    # File QuickTime senza atomo ftyp iniziale
+    if head[4:8] in (b"moov", b"mdat", b"wide", b"free", b"skip"):
+        return "video/quicktime"
+    return None
+
+def _sniff_or_raise(head: bytes) -> str:
+    if not head:
+        raise MediaTypeError("Empty file")
+    media_type = sniff_media_type(head)
+    if media_type is None:
+        raise MediaTypeError("Unsupported or unrecognized media format")
+    return media_type
+
+def media_relative_path(digest: str, extension: str) -> str:
+    """Percorso indirizzato dal contenuto: due livelli di directory evitano cartelle enormi"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+def _write_chunk(out: BinaryIO, digest, chunk: bytearray) -> None:
+    digest.update(chunk)
+    out.write(chunk)
+
+def _commit_file(temp_path: str, path: str) -> bool:
+    """Sposta il file temporaneo nel percorso definitivo; restituisce True se esisteva già"""
+    if os.path.exists(path):
+        os.remove(temp_path)
+        return True
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Sullo stesso filesystem la rinomina è atomica: un file parziale non è mai visibile
+    os.replace(temp_path, path)
+    return False
+
+class FilePartCallbacks:
+    """Callback del parser multipart: raccolgono i dati del campo "file", scritti poi fuori dal parser.
+
+    I callback sono sincroni: i dati vengono solo accodati e l'I/O avviene dopo ogni parser.write().
+    """
+
+    def __init__(self):
+        self.found = False
+        self.finished = False
+        self.declared_type: Optional[str] = None
+        self.pending: List[bytes] = []
+        self._in_file = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        # Solo il primo campo "file" viene salvato, le altre parti sono ignorate
+        self._in_file = options.get(b"name") == b"file" and not self.found
+        if self._in_file:
+            self.found = True
+            declared_type, _ = parse_options_header(self._headers.get(b"content-type", b""))
+            self.declared_type = declared_type.decode("latin-1").lower()
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self.pending.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        if self._in_file:
+            self._in_file = False
+            self.finished = True
+
+async def store_upload_stream(content_type: str, stream: AsyncIterator[bytes]) -> StoredMedia:
+    """Salva il campo "file" di un corpo multipart/form-data leggendo direttamente lo stream della richiesta.
+
+    Ogni blocco viene letto, sottoposto a hash e scritto una sola volta; l'upload si interrompe
+    appena il file supera MEDIA_MAX_BYTES. Il formato viene riconosciuto dai primi byte e non dal
+    content type dichiarato dal client. Un file già presente con lo stesso contenuto non viene duplicato.
+    """
+    mimetype, options = parse_options_header(content_type or "")
+    if mimetype != b"multipart/form-data" or not options.get(b"boundary"):
+        raise MediaUploadError("Expected a multipart/form-data body")
+
+    callbacks = FilePartCallbacks()
+    parser = MultipartParser(options[b"boundary"], callbacks.as_dict())
+
+    os.makedirs(MEDIA_TEMP_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=MEDIA_TEMP_DIR)
+
+    digest = hashlib.sha256()
+    body_size = 0
+    size = 0
+    media_type = None
+    # Dati del file non ancora scritti: i primi SNIFF_BYTES servono a riconoscere il formato
+    buffer = bytearray()
+
+    try:
+        with os.fdopen(fd, "wb") as out:
+            async for chunk in stream:
+                body_size += len(chunk)
+                if body_size > MEDIA_MAX_BODY_BYTES:
+                    raise MediaTooLargeError(f"File exceeds the maximum size of {MEDIA_MAX_BYTES} bytes")
+                try:
+                    parser.write(chunk)
+                except MultipartParseError as e:
+                    raise MediaUploadError(f"Malformed multipart body: {e}")
+
+                if callbacks.declared_type is not None and callbacks.declared_type not in MEDIA_ALLOWED_TYPES:
+                    raise MediaTypeError(f"Unsupported media type. Allowed types: {', '.join(MEDIA_ALLOWED_TYPES)}")
+
+                data = b"".join(callbacks.pending)
+                callbacks.pending.clear()
+                size += len(data)
+                if size > MEDIA_MAX_BYTES:
+                    raise MediaTooLargeError(f"File exceeds the maximum size of {MEDIA_MAX_BYTES} bytes")
+                buffer += data
+
+                if media_type is None:
+                    if len(buffer) < SNIFF_BYTES and not callbacks.finished:
+                        continue
+                    media_type = _sniff_or_raise(buffer)
+
+                # Hash e scrittura su disco fuori dall'event loop, a blocchi di MEDIA_CHUNK_SIZE
+                if len(buffer) >= MEDIA_CHUNK_SIZE or callbacks.finished:
+                    await run_in_threadpool(_write_chunk, out, digest, buffer)
+                    buffer = bytearray()
+
+            if not callbacks.found:
+                raise MediaUploadError('Missing "file" field')
+            if not callbacks.finished:
+                raise MediaUploadError("Incomplete multipart body")
+            if media_type is None:
+                media_type = _sniff_or_raise(buffer)
+            if buffer:
+                await run_in_threadpool(_write_chunk, out, digest, buffer)
+
+        sha256 = digest.hexdigest()
+        relative_path = media_relative_path(sha256, MEDIA_ALLOWED_TYPES[media_type])
+        deduplicated = await run_in_threadpool(_commit_file, temp_path, os.path.join(MEDIA_ROOT, relative_path))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return StoredMedia(
+        url=f"{MEDIA_BASE_URL}/{relative_path}",
+        sha256=sha256,
+        size=size,
+        content_type=media_type,
+        deduplicated=deduplicated
+    )
@@ -0,0 +1,71 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple, Type
+from urllib.parse import urlparse
+import httpx
+import mimetypes
+
+from services.connected_accounts import ConnectedAccount
+
+class PlatformAdapter(ABC):
+    """Adapter di pubblicazione verso una piattaforma social.
+
+    Le sottoclassi dichiarano i vincoli della piattaforma, verificati da validate() prima di
+    salvare il post o chiamare la piattaforma, e implementano publish(): un adapter che non lo
+    fa non è istanziabile, quindi register_platform fallisce già all'import.
+    """
+    name: str = ""
+    # La piattaforma non accetta post di solo testo
+    requires_media: bool = False
+    # Lunghezza massima del testo (None: nessun limite verificato)
+    max_text_length: Optional[int] = None
+    # Tipi di media accettati ("image", "video"); None se non verificati
+    media_types: Optional[Tuple[str, ...]] = None
+
+    def validate(self, content: str, media_urls: List[str]) -> List[str]:
+        """Errori che renderebbero certamente fallita la pubblicazione (lista vuota se valida)"""
+        errors = []
+        if self.requires_media and not media_urls:
+            errors.append(f"{self.name} requires {' or '.join(self.media_types or ('media',))} content")
+        if self.max_text_length is not None and len(content) > self.max_text_length:
+            errors.append(f"{self.name} text is limited to {self.max_text_length} characters ({len(content)} given)")
+        if self.media_types is not None:
+            for url in media_urls:
+                media_type = guess_media_type(url)
+                if media_type is not None and media_type not in self.media_types:
+                    errors.append(f"{self.name} does not support {media_type} media ({url})")
+        return errors
+
+    @abstractmethod
+    async def publish(self, client: httpx.AsyncClient, account: ConnectedAccount, content: str, media_urls: List[str]) -> Dict[str, Any]:
+        """Pubblica il post e restituisce almeno {"post_id": ...} della piattaforma"""
+
+PLATFORM_ADAPTERS: Dict[str, PlatformAdapter] = {}
+
+def register_platform(cls: Type[PlatformAdapter]) -> Type[PlatformAdapter]:
+    """Decoratore che registra un adapter: la piattaforma diventa pubblicabile senza modificare il dispatcher"""
+    PLATFORM_ADAPTERS[cls.name] = cls()
+    return cls
+
+def get_platform_adapter(platform: str) -> PlatformAdapter:
+    adapter = PLATFORM_ADAPTERS.get(platform)
+    if adapter is None:
+        raise ValueError(f"Unsupported platform: {platform}")
+    return adapter
+
+def guess_media_type(url: str) -> Optional[str]:
+    """Tipo del media ("image", "video") dall'estensione dell'URL, None se non riconoscibile"""
+    content_type, _ = mimetypes.guess_type(urlparse(url).path)
+    if content_type is None:
+        return None
+    return content_type.split("/", 1)[0]
+
+def validate_post(platforms: List[str], content: str, media_urls: List[str]) -> List[str]:
+    """Verifica un post per tutte le piattaforme selezionate, senza accessi al database né chiamate remote"""
+    errors = []
+    for platform in dict.fromkeys(platforms):
+        adapter = PLATFORM_ADAPTERS.get(platform)
+        if adapter is None:
+            errors.append(f"Unsupported platform: {platform}")
+        else:
+            errors.extend(adapter.validate(content, media_urls))
+    return errors
@@ -0,0 +1,49 @@
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models.models import Post, PostMedia, PostTarget
+
+def post_target_rows(post_id: Optional[int], platforms: List[str]) -> List[Dict[str, Any]]:
+    """Righe di post_targets per un post, senza piattaforme duplicate"""
+    return [
+        {"post_id": post_id, "platform": platform, "position": position}
+        for position, platform in enumerate(dict.fromkeys(platforms))
+    ]
+
+def post_media_rows(post_id: Optional[int], media_urls: List[str]) -> List[Dict[str, Any]]:
+    """Righe di post_media per un post, nell'ordine della richiesta"""
+    return [
+        {"post_id": post_id, "position": position, "url": url}
+        for position, url in enumerate(media_urls)
+    ]
+
+def post_platforms(post: Post) -> List[str]:
+    """Piattaforme selezionate di un post, da post_targets (caricare Post.targets con selectinload)"""
+    return [target.platform for target in post.targets]
+
+def post_media_urls(post: Post) -> List[str]:
+    """URL dei media di un post nell'ordine originale, da post_media (caricare Post.media con selectinload)"""
+    return [media.url for media in post.media]
+
+def build_post_children(platforms: List[str], media_urls: List[str]) -> Tuple[List[PostTarget], List[PostMedia]]:
+    """Oggetti PostTarget e PostMedia da assegnare a un nuovo Post (salvati con lo stesso flush)"""
+    targets = [PostTarget(platform=row["platform"], position=row["position"]) for row in post_target_rows(None, platforms)]
+    media = [PostMedia(url=row["url"], position=row["position"]) for row in post_media_rows(None, media_urls)]
+    return targets, media
+
+async def insert_post_children(db: AsyncSession, posts: Iterable[Tuple[int, List[str], List[str]]]) -> None:
+    """Inserisce piattaforme e media di più post con un INSERT multiplo per tabella.
+
+    posts contiene tuple (post_id, piattaforme, media_urls).
+    """
+    target_rows = []
+    media_rows = []
+    for post_id, platforms, media_urls in posts:
+        target_rows.extend(post_target_rows(post_id, platforms))
+        media_rows.extend(post_media_rows(post_id, media_urls))
+
+    if target_rows:
+        await db.execute(insert(PostTarget), target_rows)
+    if media_rows:
+        await db.execute(insert(PostMedia), media_rows)
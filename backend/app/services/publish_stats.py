@@ -0,0 +1,65 @@
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Tuple
+from datetime import date, datetime
+
+from models.models import PostResult, PublishStatsDaily
+from services.data_version import bump_data_version
+
+def aggregate_post_results(user_id: int, results: List[PostResult], day: date) -> List[Dict[str, Any]]:
+    """Incrementi delle statistiche giornaliere, una riga per piattaforma"""
+    rows: Dict[Tuple[int, date, str], Dict[str, Any]] = {}
+    for result in results:
+        row = rows.setdefault((user_id, day, result.platform), {
+            "user_id": user_id,
+            "day": day,
+            "platform": result.platform,
+            "success_count": 0,
+            "failure_count": 0,
+            "latency_count": 0,
+            "latency_ms_total": 0,
+            "latency_ms_max": 0
+        })
+        if result.status == "success":
+            row["success_count"] += 1
+        else:
+            row["failure_count"] += 1
+        if result.latency_ms is not None:
+            row["latency_count"] += 1
+            row["latency_ms_total"] += result.latency_ms
+            row["latency_ms_max"] = max(row["latency_ms_max"], result.latency_ms)
+    return list(rows.values())
+
+def upsert_publish_stats_statement(dialect_name: str, rows: List[Dict[str, Any]]):
+    """INSERT ... ON CONFLICT DO UPDATE che somma gli incrementi alle righe esistenti (SQLite e PostgreSQL)"""
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert(PublishStatsDaily).values(rows)
+    table = PublishStatsDaily.__table__.c
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[table.user_id, table.day, table.platform],
+        set_={
+            "success_count": table.success_count + excluded.success_count,
+            "failure_count": table.failure_count + excluded.failure_count,
+            "latency_count": table.latency_count + excluded.latency_count,
+            "latency_ms_total": table.latency_ms_total + excluded.latency_ms_total,
+            "latency_ms_max": case(
+                (excluded.latency_ms_max > table.latency_ms_max, excluded.latency_ms_max),
+                else_=table.latency_ms_max
+            ),
+            "updated_at": func.now()
+        }
+    )
+
+async def record_post_results(db: AsyncSession, user_id: int, results: List[PostResult]) -> None:
+    """Aggiunge i PostResult alla sessione e aggiorna publish_stats_daily nella stessa transazione (senza commit).
+
+    Incrementa anche la versione dei dati dell'utente usata dagli ETag.
+    """
+    if not results:
+        return
+    db.add_all(results)
+    rows = aggregate_post_results(user_id, results, datetime.utcnow().date())
+    await db.execute(upsert_publish_stats_statement(db.get_bind().dialect.name, rows))
+    await bump_data_version(db, user_id)
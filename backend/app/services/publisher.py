@@ -0,0 +1,626 @@
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import httpx
+import os
+import random
+import time
+from dotenv import load_dotenv
+
+from models.models import SocialToken, Post, PostResult
+from services.connected_accounts import ConnectedAccount, update_connected_account
+from services.data_version import bump_data_version
+from services.platforms import PlatformAdapter, get_platform_adapter, register_platform
+from services.publish_stats import record_post_results
+from utils.cache import platform_account_cache, token_fingerprint
+from utils.circuit_breaker import CircuitOpenError, circuit_breakers
+from utils.metrics import publish_duration
+from utils.rate_limit import RateLimitedError, rate_limiter
+
+load_dotenv()
+
+# Configurazione della pubblicazione: fan-out concorrente, timeout per piattaforma e deadline complessiva
+PUBLISH_CONCURRENT = os.getenv("PUBLISH_CONCURRENT", "true").lower() in ("1", "true", "yes")
+PUBLISH_PLATFORM_TIMEOUT = float(os.getenv("PUBLISH_PLATFORM_TIMEOUT", "30"))
+PUBLISH_DEADLINE = float(os.getenv("PUBLISH_DEADLINE", "45"))
+# Tentativi dopo una risposta di limite superato, se l'attesa richiesta rientra in RATE_LIMIT_MAX_WAIT
+PUBLISH_RATE_LIMIT_RETRIES = int(os.getenv("PUBLISH_RATE_LIMIT_RETRIES", "3"))
+# Nuovi tentativi per errori transitori (rete, 5xx) con backoff esponenziale e jitter (secondi)
+PUBLISH_RETRIES = int(os.getenv("PUBLISH_RETRIES", "2"))
+PUBLISH_RETRY_BASE_DELAY = float(os.getenv("PUBLISH_RETRY_BASE_DELAY", "0.5"))
+PUBLISH_RETRY_MAX_DELAY = float(os.getenv("PUBLISH_RETRY_MAX_DELAY", "8"))
+# Dopo quanti rinvii per piattaforma non disponibile un job viene considerato fallito
+PUBLISH_MAX_DEFERRALS = int(os.getenv("PUBLISH_MAX_DEFERRALS", "10"))
+
+TRANSIENT_STATUS_CODES = (500, 502, 503, 504)
+# Errori in cui la richiesta non è mai arrivata alla piattaforma: ripetibili anche per i POST
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+async def save_publish_outcomes(
+    db: AsyncSession,
+    post: Post,
+    tokens_by_platform: Dict[str, ConnectedAccount],
+    outcomes: Dict[str, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Registra gli esiti della pubblicazione come PostResult (senza commit) e li restituisce per la risposta.
+
+    Le statistiche giornaliere in publish_stats_daily vengono aggiornate nella stessa transazione.
+    """
+    
+    results = []
+    post_results = []
+    
+    for platform, outcome in outcomes.items():
+        if outcome["status"] == "success":
+            # Salva il risultato nel database
+            post_result = PostResult(
+                post_id=post.id,
+                platform=platform,
+                platform_post_id=outcome.get("post_id"),
+                status="success",
+                latency_ms=outcome.get("latency_ms"),
+                published_at=outcome["published_at"]
+            )
+            
+            post_results.append(post_result)
+            
+            # Salva l'ID dell'account sulla piattaforma se è stato letto durante la pubblicazione
+            token = tokens_by_platform.get(platform)
+            if token is not None and outcome.get("platform_user_id") and outcome["platform_user_id"] != token.platform_user_id:
+                await db.execute(update(SocialToken).filter(SocialToken.id == token.id).values(
+                    platform_user_id=outcome["platform_user_id"]
+                ))
+                await bump_data_version(db, token.user_id)
+                update_connected_account(token.user_id, platform, platform_user_id=outcome["platform_user_id"])
+            
+            results.append({
+                "platform": platform,
+                "status": "success",
+                "post_id": outcome.get("post_id")
+            })
+        elif outcome.get("retry_at"):
+            # Nessun PostResult: la piattaforma viene pubblicata da un job più tardi
+            results.append({
+                "platform": platform,
+                "status": outcome["status"],
+                "error": outcome["error"],
+                "retry_at": outcome["retry_at"]
+            })
+        else:
+            # Salva l'errore nel database
+            post_result = PostResult(
+                post_id=post.id,
+                platform=platform,
+                status="failed",
+                error_message=outcome["error"],
+                latency_ms=outcome.get("latency_ms")
+            )
+            
+            post_results.append(post_result)
+            results.append({
+                "platform": platform,
+                "status": "failed",
+                "error": outcome["error"]
+            })
+    
+    await record_post_results(db, post.user_id, post_results)
+    
+    return results
+
+def compute_post_status(success_count: int, total: int) -> str:
+    """Calcola lo status complessivo di un post dal numero di pubblicazioni riuscite"""
+    if success_count >= total:
+        return "published"
+    elif success_count > 0:
+        return "partially_published"
+    return "failed"
+
+async def publish_to_platforms(client: httpx.AsyncClient, tokens: List[ConnectedAccount], content: str, media_urls: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Pubblica su più piattaforme, in parallelo o in sequenza, con timeout e deadline complessiva.
+
+    Restituisce un esito per ogni piattaforma, nello stesso ordine dei token: le piattaforme che
+    non terminano entro il timeout o la deadline risultano fallite senza bloccare le altre.
+    """
+    
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PUBLISH_DEADLINE
+    
+    async def publish_one(token: ConnectedAccount) -> None:
+        # Ogni piattaforma ha il proprio timeout, mai oltre la deadline complessiva
+        timeout = min(PUBLISH_PLATFORM_TIMEOUT, max(deadline - loop.time(), 0))
+        started_at = time.perf_counter()
+        outcome = "failed"
+        try:
+            result = await asyncio.wait_for(
+                publish_to_platform(client, token, content, media_urls),
+                timeout=timeout
+            )
+            outcomes[token.platform] = {
+                "status": "success",
+                "post_id": result.get("post_id"),
+                "platform_user_id": result.get("platform_user_id"),
+                "published_at": datetime.utcnow()
+            }
+            outcome = "success"
+        except (RateLimitedError, CircuitOpenError) as e:
+            # Non è un errore definitivo: la pubblicazione viene riprogrammata dopo il limite
+            # o quando il circuito della piattaforma torna a permettere chiamate
+            outcomes[token.platform] = {
+                "status": "rate_limited" if isinstance(e, RateLimitedError) else "unavailable",
+                "error": str(e),
+                "retry_at": datetime.utcnow() + timedelta(seconds=e.retry_after)
+            }
+            outcome = outcomes[token.platform]["status"]
+        except asyncio.TimeoutError:
+            outcomes[token.platform] = {
+                "status": "failed",
+                "error": f"Timeout after {timeout:g}s"
+            }
+            outcome = "timeout"
+        except Exception as e:
+            outcomes[token.platform] = {"status": "failed", "error": str(e)}
+        finally:
+            # Anche le pubblicazioni interrotte dalla deadline complessiva vengono misurate (come failed)
+            elapsed = time.perf_counter() - started_at
+            publish_duration.observe(elapsed, token.platform, outcome)
+            if token.platform in outcomes:
+                outcomes[token.platform]["latency_ms"] = round(elapsed * 1000)
+    
+    if PUBLISH_CONCURRENT:
+        tasks = [asyncio.create_task(publish_one(token)) for token in tokens]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=PUBLISH_DEADLINE)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    else:
+        for token in tokens:
+            if loop.time() >= deadline:
+                break
+            await publish_one(token)
+    
+    # Le piattaforme senza esito sono state interrotte dalla deadline complessiva
+    for token in tokens:
+        outcomes.setdefault(token.platform, {
+            "status": "failed",
+            "error": f"Publishing deadline of {PUBLISH_DEADLINE:g}s exceeded"
+        })
+    
+    return {token.platform: outcomes[token.platform] for token in tokens}
+
+async def publish_to_platform(client: httpx.AsyncClient, token: ConnectedAccount, content: str, media_urls: List[str]) -> Dict[str, Any]:
+    """Pubblica contenuto su una specifica piattaforma social tramite il suo adapter"""
+    
+    adapter = get_platform_adapter(token.platform)
+    
+    # I post programmati o in coda sono stati salvati prima della verifica: falliscono senza chiamate remote
+    errors = adapter.validate(content, media_urls)
+    if errors:
+        raise ValueError("; ".join(errors))
+    
+    return await adapter.publish(client, token, content, media_urls)
+
+def is_transient_response(response: httpx.Response) -> bool:
+    """Risposta di errore temporaneo della piattaforma (5xx o errore Graph marcato is_transient)"""
+    if response.status_code in TRANSIENT_STATUS_CODES:
+        return True
+    if not response.is_error:
+        return False
+    try:
+        return bool(response.json().get("error", {}).get("is_transient"))
+    except (ValueError, AttributeError):
+        return False
+
+def is_retryable(method: str, error: Optional[httpx.TransportError] = None, response: Optional[httpx.Response] = None) -> bool:
+    """Decide se ripetere una chiamata fallita senza rischiare pubblicazioni duplicate.
+
+    Le GET si ripetono per ogni errore transitorio; i POST solo se la richiesta non è stata
+    elaborata: errore di connessione, 503 o errore Graph dichiarato transitorio.
+    """
+    if error is not None:
+        return method == "GET" or isinstance(error, CONNECT_ERRORS)
+    if method == "GET":
+        return True
+    return response.status_code == 503 or (response.status_code not in TRANSIENT_STATUS_CODES and is_transient_response(response))
+
+def retry_delay(attempt: int) -> float:
+    """Backoff esponenziale con full jitter, per non sincronizzare i tentativi dei worker"""
+    return random.uniform(0, min(PUBLISH_RETRY_MAX_DELAY, PUBLISH_RETRY_BASE_DELAY * 2 ** attempt))
+
+async def platform_request(client: httpx.AsyncClient, platform: str, access_token: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """Esegue una chiamata verso una piattaforma con rate limiter, retry e circuit breaker.
+
+    La chiamata attende in coda il proprio turno sul bucket della piattaforma e dell'account;
+    una risposta di limite superato blocca il bucket per il tempo indicato dalla piattaforma e
+    la chiamata viene ripetuta, oppure solleva RateLimitedError se l'attesa è troppo lunga.
+    Gli errori transitori vengono ripetuti con backoff e contano per il circuit breaker della
+    piattaforma, che quando è aperto fa fallire subito le chiamate con CircuitOpenError.
+    """
+    account = token_fingerprint(access_token)
+    breaker = circuit_breakers.get(platform)
+    attempt = 0
+    rate_limit_retries = 0
+    
+    while True:
+        # Prima il turno sul rate limiter, poi il circuit breaker: in half-open before_call occupa
+        # il posto della chiamata di verifica, che va preso solo quando la richiesta parte davvero
+        # (un RateLimitedError o un'attesa lunga in coda lo terrebbero occupato senza verifica)
+        await rate_limiter.acquire(platform, account)
+        breaker.before_call()
+        
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            if attempt >= PUBLISH_RETRIES or not is_retryable(method, error=e):
+                raise
+            await asyncio.sleep(retry_delay(attempt))
+            attempt += 1
+            continue
+        
+        if is_transient_response(response):
+            breaker.record_failure()
+            if attempt < PUBLISH_RETRIES and is_retryable(method, response=response):
+                await asyncio.sleep(retry_delay(attempt))
+                attempt += 1
+                continue
+            # Tentativi esauriti: l'adapter solleva l'errore con raise_for_status
+            return response
+        
+        # Anche un errore 4xx dimostra che la piattaforma risponde
+        breaker.record_success()
+        
+        retry_after = rate_limiter.observe(platform, account, response)
+        if retry_after is None:
+            return response
+        
+        rate_limit_retries += 1
+        if rate_limit_retries > PUBLISH_RATE_LIMIT_RETRIES:
+            raise RateLimitedError(platform, retry_after)
+
+def is_graph_auth_error(response: httpx.Response) -> bool:
+    """Verifica se una risposta della Graph API indica un token o permessi non più validi"""
+    if not response.is_error:
+        return False
+    if response.status_code in (401, 403):
+        return True
+    try:
+        graph_error = response.json().get("error", {})
+    except ValueError:
+        return False
+    return graph_error.get("code") in (190, 200) or graph_error.get("type") == "OAuthException"
+
+async def resolve_facebook_page(client: httpx.AsyncClient, access_token: str, refresh: bool = False) -> Tuple[Dict[str, str], bool]:
+    """Restituisce ID e token della prima pagina Facebook dell'utente e se provengono dalla cache"""
+    
+    cache_key = ("facebook_page", token_fingerprint(access_token))
+    if not refresh:
+        page = platform_account_cache.get(cache_key)
+        if page is not None:
+            return page, True
+    
+    # Ottieni le pagine dell'utente
+    pages_response = await platform_request(
+        client, "facebook", access_token, "GET",
+        "https://graph.facebook.com/me/accounts",
+        params={"access_token": access_token}
+    )
+    pages_response.raise_for_status()
+    pages_data = pages_response.json()
+    
+    if not pages_data.get("data"):
+        raise Exception("No Facebook pages found")
+    
+    # Usa la prima pagina disponibile
+    page = {
+        "id": pages_data["data"][0]["id"],
+        "access_token": pages_data["data"][0]["access_token"]
+    }
+    platform_account_cache.set(cache_key, page)
+    
+    return page, False
+
+async def resolve_instagram_account(client: httpx.AsyncClient, access_token: str, refresh: bool = False) -> Tuple[str, bool]:
+    """Restituisce l'ID dell'account Instagram Business collegato e se proviene dalla cache"""
+    
+    cache_key = ("instagram_account", token_fingerprint(access_token))
+    if not refresh:
+        instagram_account_id = platform_account_cache.get(cache_key)
+        if instagram_account_id is not None:
+            return instagram_account_id, True
+    
+    # Ottieni l'account Instagram Business collegato
+    accounts_response = await platform_request(
+        client, "instagram", access_token, "GET",
+        "https://graph.facebook.com/me/accounts",
+        params={
+            "fields": "instagram_business_account",
+            "access_token": access_token
+        }
+    )
+    accounts_response.raise_for_status()
+    accounts_data = accounts_response.json()
+    
+    instagram_account_id = None
+    for page in accounts_data.get("data", []):
+        if page.get("instagram_business_account"):
+            instagram_account_id = page["instagram_business_account"]["id"]
+            break
+    
+    if not instagram_account_id:
+        raise Exception("No Instagram Business account found")
+    
+    platform_account_cache.set(cache_key, instagram_account_id)
+    
+    return instagram_account_id, False
+
+async def publish_to_facebook(client: httpx.AsyncClient, access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
+    """Pubblica su Facebook"""
+    
+    # Prima ottieni l'ID della pagina Facebook (dalla cache se disponibile)
+    page, cached = await resolve_facebook_page(client, access_token)
+    
+    # Pubblica il post
+    post_data = {
+        "message": content,
+        "access_token": page["access_token"]
+    }
+    
+    # Se ci sono media, aggiungi il primo
+    if media_urls:
+        post_data["link"] = media_urls[0]
+    
+    response = await platform_request(
+        client, "facebook", access_token, "POST",
+        f"https://graph.facebook.com/{page['id']}/feed",
+        data=post_data
+    )
+    
+    # Un errore di autenticazione con dati in cache forza una nuova risoluzione della pagina
+    if cached and is_graph_auth_error(response):
+        page, _ = await resolve_facebook_page(client, access_token, refresh=True)
+        post_data["access_token"] = page["access_token"]
+        response = await platform_request(
+            client, "facebook", access_token, "POST",
+            f"https://graph.facebook.com/{page['id']}/feed",
+            data=post_data
+        )
+    
+    response.raise_for_status()
+    result = response.json()
+    
+    return {"post_id": result.get("id")}
+
+async def publish_to_instagram(client: httpx.AsyncClient, access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
+    """Pubblica su Instagram"""
+    
+    # Ottieni l'account Instagram Business collegato (dalla cache se disponibile)
+    instagram_account_id, cached = await resolve_instagram_account(client, access_token)
+    
+    # Per Instagram, è necessario prima caricare il media, poi pubblicare
+    # Questo è un esempio semplificato per post di testo
+    if media_urls:
+        # Crea un container per il media
+        container_data = {
+            "image_url": media_urls[0],
+            "caption": content,
+            "access_token": access_token
+        }
+        
+        container_response = await platform_request(
+            client, "instagram", access_token, "POST",
+            f"https://graph.facebook.com/{instagram_account_id}/media",
+            data=container_data
+        )
+        
+        # Un errore di autenticazione con dati in cache forza una nuova risoluzione dell'account
+        if cached and is_graph_auth_error(container_response):
+            instagram_account_id, _ = await resolve_instagram_account(client, access_token, refresh=True)
+            container_response = await platform_request(
+                client, "instagram", access_token, "POST",
+                f"https://graph.facebook.com/{instagram_account_id}/media",
+                data=container_data
+            )
+        
+        container_response.raise_for_status()
+        container_result = container_response.json()
+        
+        # Pubblica il container
+        publish_data = {
+            "creation_id": container_result["id"],
+            "access_token": access_token
+        }
+        
+        publish_response = await platform_request(
+            client, "instagram", access_token, "POST",
+            f"https://graph.facebook.com/{instagram_account_id}/media_publish",
+            data=publish_data
+        )
+        publish_response.raise_for_status()
+        publish_result = publish_response.json()
+        
+        return {"post_id": publish_result.get("id")}
+    else:
+        raise Exception("Instagram requires media content")
+
+async def resolve_linkedin_author(client: httpx.AsyncClient, access_token: str, profile_id: Optional[str] = None, refresh: bool = False) -> Tuple[str, bool]:
+    """Restituisce l'ID del profilo LinkedIn dell'autore e se proviene da dati già noti.
+
+    Usa, nell'ordine, l'ID salvato sul token social e la cache in memoria: l'API LinkedIn
+    viene interrogata solo se l'ID manca o è stato rifiutato (refresh=True).
+    """
+    
+    cache_key = ("linkedin_author", token_fingerprint(access_token))
+    if not refresh:
+        if profile_id:
+            return profile_id, True
+        cached_profile_id = platform_account_cache.get(cache_key)
+        if cached_profile_id is not None:
+            return cached_profile_id, True
+    
+    # Ottieni l'ID del profilo
+    profile_response = await platform_request(
+        client, "linkedin", access_token, "GET",
+        "https://api.linkedin.com/v2/people/~",
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    profile_response.raise_for_status()
+    profile_data = profile_response.json()
+    profile_id = profile_data["id"]
+    
+    platform_account_cache.set(cache_key, profile_id)
+    
+    return profile_id, False
+
+async def publish_to_linkedin(client: httpx.AsyncClient, access_token: str, content: str, media_urls: List[str], profile_id: Optional[str] = None) -> Dict[str, Any]:
+    """Pubblica su LinkedIn"""
+    
+    # Ottieni l'ID del profilo (salvato alla connessione o in cache)
+    profile_id, known = await resolve_linkedin_author(client, access_token, profile_id)
+    
+    # Prepara il post
+    post_data = {
+        "author": f"urn:li:person:{profile_id}",
+        "lifecycleState": "PUBLISHED",
+        "specificContent": {
+            "com.linkedin.ugc.ShareContent": {
+                "shareCommentary": {
+                    "text": content
+                },
+                "shareMediaCategory": "NONE"
+            }
+        },
+        "visibility": {
+            "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
+        }
+    }
+    
+    # Se ci sono media, aggiungi il link
+    if media_urls:
+        post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["shareMediaCategory"] = "ARTICLE"
+        post_data["specificContent"]["com.linkedin.ugc.ShareContent"]["media"] = [{
+            "status": "READY",
+            "originalUrl": media_urls[0]
+        }]
+    
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    response = await platform_request(
+        client, "linkedin", access_token, "POST",
+        "https://api.linkedin.com/v2/ugcPosts",
+        headers=headers,
+        json=post_data
+    )
+    
+    # Se l'autore salvato viene rifiutato, rileggi il profilo e riprova una volta
+    if known and response.status_code in (401, 403, 422):
+        profile_id, known = await resolve_linkedin_author(client, access_token, refresh=True)
+        post_data["author"] = f"urn:li:person:{profile_id}"
+        response = await platform_request(
+            client, "linkedin", access_token, "POST",
+            "https://api.linkedin.com/v2/ugcPosts",
+            headers=headers,
+            json=post_data
+        )
+    
+    response.raise_for_status()
+    result = response.json()
+    
+    # L'ID del profilo viene restituito per salvarlo sul token social
+    return {"post_id": result.get("id"), "platform_user_id": profile_id}
+
+async def publish_to_twitter(client: httpx.AsyncClient, access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
+    """Pubblica su Twitter/X"""
+    
+    # Il limite di 280 caratteri è verificato da TwitterAdapter: il testo non viene mai troncato
+    post_data = {"text": content}
+    
+    response = await platform_request(
+        client, "twitter", access_token, "POST",
+        "https://api.twitter.com/2/tweets",
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        },
+        json=post_data
+    )
+    response.raise_for_status()
+    result = response.json()
+    
+    return {"post_id": result["data"]["id"]}
+
+async def publish_to_tiktok(client: httpx.AsyncClient, access_token: str, content: str, media_urls: List[str]) -> Dict[str, Any]:
+    """Pubblica su TikTok"""
+    
+    # TikTok richiede video, non supporta post di solo testo
+    if not media_urls:
+        raise Exception("TikTok requires video content")
+    
+    # Questo è un esempio semplificato
+    # TikTok API richiede un processo più complesso per il caricamento video
+    post_data = {
+        "video_url": media_urls[0],
+        "text": content,
+        "privacy_level": "PUBLIC_TO_EVERYONE"
+    }
+    
+    response = await platform_request(
+        client, "tiktok", access_token, "POST",
+        "https://open-api.tiktok.com/share/video/upload/",
+        headers={"Authorization": f"Bearer {access_token}"},
+        json=post_data
+    )
+    response.raise_for_status()
+    result = response.json()
+    
+    return {"post_id": result.get("share_id")}
+
+@register_platform
+class FacebookAdapter(PlatformAdapter):
+    name = "facebook"
+    max_text_length = 63206
+
+    async def publish(self, client: httpx.AsyncClient, account: ConnectedAccount, content: str, media_urls: List[str]) -> Dict[str, Any]:
+        return await publish_to_facebook(client, account.access_token, content, media_urls)
+
+@register_platform
+class InstagramAdapter(PlatformAdapter):
+    name = "instagram"
+    requires_media = True
+    max_text_length = 2200
+    # Il container viene creato con image_url
+    media_types = ("image",)
+
+    async def publish(self, client: httpx.AsyncClient, account: ConnectedAccount, content: str, media_urls: List[str]) -> Dict[str, Any]:
+        return await publish_to_instagram(client, account.access_token, content, media_urls)
+
+@register_platform
+class LinkedInAdapter(PlatformAdapter):
+    name = "linkedin"
+    max_text_length = 3000
+
+    async def publish(self, client: httpx.AsyncClient, account: ConnectedAccount, content: str, media_urls: List[str]) -> Dict[str, Any]:
+        return await publish_to_linkedin(client, account.access_token, content, media_urls, account.platform_user_id)
+
+@register_platform
+class TwitterAdapter(PlatformAdapter):
+    name = "twitter"
+    max_text_length = 280
+
+    async def publish(self, client: httpx.AsyncClient, account: ConnectedAccount, content: str, media_urls: List[str]) -> Dict[str, Any]:
+        return await publish_to_twitter(client, account.access_token, content, media_urls)
+
+@register_platform
+class TikTokAdapter(PlatformAdapter):
+    name = "tiktok"
+    requires_media = True
+    max_text_length = 2200
+    media_types = ("video",)
+
+    async def publish(self, client: httpx.AsyncClient, account: ConnectedAccount, content: str, media_urls: List[str]) -> Dict[str, Any]:
+        return await publish_to_tiktok(client, account.access_token, content, media_urls)
@@ -0,0 +1,185 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional, Set, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import heapq
+import logging
+import os
+from dotenv import load_dotenv
+
+from db.database import AsyncSessionLocal
+from models.models import Post
+from services.data_version import bump_data_version
+from services.job_queue import enqueue_publish_jobs, worker_pool
+from services.post_targets import post_platforms
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configurazione dello scheduler dei post programmati
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Finestra di post futuri tenuti in memoria nel min-heap (secondi)
+SCHEDULER_HORIZON = float(os.getenv("SCHEDULER_HORIZON", "300"))
+# Ogni quanto ricaricare la finestra dal database, per i post creati da altri processi (secondi)
+SCHEDULER_REFRESH_INTERVAL = float(os.getenv("SCHEDULER_REFRESH_INTERVAL", "60"))
+# Numero massimo di post caricati per finestra e pubblicati per batch
+SCHEDULER_LOAD_LIMIT = int(os.getenv("SCHEDULER_LOAD_LIMIT", "10000"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "100"))
+
+def as_utc_naive(value: datetime) -> datetime:
+    """Normalizza una data in UTC senza timezone, come quelle prodotte da datetime.utcnow()"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def load_due_posts(db: AsyncSession, until: datetime, limit: int) -> List[Tuple[datetime, int]]:
+    """Carica i post programmati entro una data usando l'indice (status, scheduled_at)"""
+    rows = (await db.execute(select(Post.scheduled_at, Post.id).filter(
+        Post.status == "scheduled",
+        Post.scheduled_at <= until
+    ).order_by(Post.scheduled_at).limit(limit))).all()
+    return [(as_utc_naive(scheduled_at), post_id) for scheduled_at, post_id in rows]
+
+async def claim_scheduled_posts(db: AsyncSession, post_ids: List[int]) -> List[Post]:
+    """Passa i post scaduti da "scheduled" a "queued" e accoda un job per piattaforma.
+
+    L'UPDATE condizionato sullo status evita doppie pubblicazioni quando più processi
+    caricano gli stessi post; i post riprogrammati o cancellati nel frattempo vengono saltati.
+    """
+    now = datetime.utcnow()
+    claimed = []
+
+    for post_id in post_ids:
+        updated = await db.execute(update(Post).filter(
+            Post.id == post_id,
+            Post.status == "scheduled",
+            Post.scheduled_at <= now
+        ).values(status="queued"))
+        if updated.rowcount:
+            claimed.append(post_id)
+
+    posts = (await db.scalars(select(Post).options(selectinload(Post.targets)).filter(
+        Post.id.in_(claimed)
+    ))).all() if claimed else []
+    for post in posts:
+        enqueue_publish_jobs(db, post, post_platforms(post))
+    await bump_data_version(db, *(post.user_id for post in posts))
+
+    await db.commit()
+    return posts
+
+class PostScheduler:
+    """Scheduler in-process dei post programmati.
+
+    Tiene in un min-heap i post in scadenza entro SCHEDULER_HORIZON e dorme fino al primo:
+    il database viene letto solo per ricaricare la finestra (query sull'indice, mai una
+    scansione della tabella) e i post scaduti passano alla coda dei job a batch.
+    Al riavvio la finestra viene ricaricata dalla tabella posts, compresi i post già scaduti.
+    """
+
+    def __init__(self, horizon: float, refresh_interval: float, load_limit: int, batch_size: int):
+        self.horizon = horizon
+        self.refresh_interval = refresh_interval
+        self.load_limit = load_limit
+        self.batch_size = batch_size
+        self._heap: List[Tuple[datetime, int]] = []
+        self._pending: Set[int] = set()
+        self._loaded_until = datetime.min
+        self._next_refresh = datetime.min
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def schedule(self, post_id: int, scheduled_at: datetime) -> None:
+        """Registra un post appena programmato se cade nella finestra già caricata"""
+        scheduled_at = as_utc_naive(scheduled_at)
+        if scheduled_at <= self._loaded_until:
+            self._push(scheduled_at, post_id)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _push(self, scheduled_at: datetime, post_id: int) -> None:
+        if post_id not in self._pending:
+            self._pending.add(post_id)
+            heapq.heappush(self._heap, (scheduled_at, post_id))
+
+    async def _refresh(self) -> None:
+        """Ricarica dal database la finestra dei post in scadenza"""
+        until = datetime.utcnow() + timedelta(seconds=self.horizon)
+        async with AsyncSessionLocal() as db:
+            due_posts = await load_due_posts(db, until, self.load_limit)
+
+        for scheduled_at, post_id in due_posts:
+            self._push(scheduled_at, post_id)
+
+        # Con la finestra troncata dal limite, i post oltre l'ultimo caricato arrivano al prossimo refresh
+        if len(due_posts) >= self.load_limit:
+            until = due_posts[-1][0]
+        self._loaded_until = until
+        self._next_refresh = datetime.utcnow() + timedelta(seconds=self.refresh_interval)
+
+    async def _publish_due(self) -> int:
+        """Estrae dal heap un batch di post scaduti e li passa alla coda di pubblicazione"""
+        now = datetime.utcnow()
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            _, post_id = heapq.heappop(self._heap)
+            self._pending.discard(post_id)
+            batch.append(post_id)
+
+        if batch:
+            async with AsyncSessionLocal() as db:
+                posts = await claim_scheduled_posts(db, batch)
+            if posts:
+                worker_pool.notify()
+                logger.info("Queued %d scheduled posts for publishing", len(posts))
+
+        return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if datetime.utcnow() >= self._next_refresh:
+                    await self._refresh()
+
+                if await self._publish_due():
+                    continue
+            except Exception:
+                logger.exception("Scheduler iteration failed")
+                await asyncio.sleep(min(self.refresh_interval, 5))
+                continue
+
+            # Dorme fino al prossimo post in scadenza, al prossimo refresh o a un nuovo post
+            now = datetime.utcnow()
+            wake_at = self._next_refresh
+            if self._heap:
+                wake_at = min(wake_at, self._heap[0][0])
+            timeout = max((wake_at - now).total_seconds(), 0)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+scheduler = PostScheduler(
+    horizon=SCHEDULER_HORIZON,
+    refresh_interval=SCHEDULER_REFRESH_INTERVAL,
+    load_limit=SCHEDULER_LOAD_LIMIT,
+    batch_size=SCHEDULER_BATCH_SIZE
+)
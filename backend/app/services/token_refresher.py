@@ -0,0 +1,271 @@
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import httpx
+import logging
+import os
+from dotenv import load_dotenv
+
+from db.database import AsyncSessionLocal
+from models.models import SocialToken
+from routes.auth import OAUTH_CONFIGS
+from services.connected_accounts import update_connected_account
+from services.data_version import bump_data_version
+from utils.cache import invalidate_token_caches
+from utils.http_client import get_http_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configurazione del refresh automatico dei token OAuth. Può girare in più processi: ogni token
+# viene rinnovato solo dal processo che ne prende il lease (vedi claim_tokens)
+TOKEN_REFRESH_ENABLED = os.getenv("TOKEN_REFRESH_ENABLED", "true").lower() in ("1", "true", "yes")
+# Ogni quanto cercare i token in scadenza e con quanto anticipo rinnovarli (secondi)
+TOKEN_REFRESH_INTERVAL = float(os.getenv("TOKEN_REFRESH_INTERVAL", "300"))
+TOKEN_REFRESH_WINDOW = float(os.getenv("TOKEN_REFRESH_WINDOW", "3600"))
+# Token rinnovati per batch e chiamate contemporanee verso gli endpoint OAuth
+TOKEN_REFRESH_BATCH_SIZE = int(os.getenv("TOKEN_REFRESH_BATCH_SIZE", "100"))
+TOKEN_REFRESH_CONCURRENCY = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "10"))
+# Dopo quanto il lease di un refresher terminato senza rilasciarlo scade (secondi)
+TOKEN_REFRESH_LEASE = float(os.getenv("TOKEN_REFRESH_LEASE", "600"))
+
+# Facebook e Instagram non usano refresh token: un token ancora valido si scambia con uno nuovo
+GRAPH_PLATFORMS = ("facebook", "instagram")
+
+class TokenRefreshError(Exception):
+    """Errore del refresh; permanent indica che la piattaforma lo ha rifiutato (serve riconnettersi)"""
+
+    def __init__(self, message: str, permanent: bool):
+        super().__init__(message)
+        self.permanent = permanent
+
+async def load_expiring_tokens(db: AsyncSession, until: datetime, limit: int, after: Optional[Tuple[datetime, int]] = None) -> List[SocialToken]:
+    """Token attivi in scadenza entro una data e rinnovabili, usando l'indice su expires_at.
+
+    after è la posizione (expires_at, id) dell'ultimo token del batch precedente.
+    """
+    query = select(SocialToken).filter(
+        SocialToken.expires_at <= until,
+        SocialToken.is_active == True,
+        SocialToken.refresh_failed_at.is_(None),
+        or_(SocialToken.refresh_token.isnot(None), SocialToken.platform.in_(GRAPH_PLATFORMS))
+    )
+    if after is not None:
+        query = query.filter(or_(
+            SocialToken.expires_at > after[0],
+            and_(SocialToken.expires_at == after[0], SocialToken.id > after[1])
+        ))
+    return (await db.scalars(query.order_by(SocialToken.expires_at, SocialToken.id).limit(limit))).all()
+
+async def claim_tokens(db: AsyncSession, tokens: List[SocialToken], until: datetime) -> List[SocialToken]:
+    """Prende il lease dei token da rinnovare e li rilegge; restituisce quelli presi da questo processo.
+
+    Come per i job di pubblicazione, l'UPDATE condizionato rende la presa atomica tra processi:
+    due refresher non usano mai lo stesso refresh token, che con la rotazione verrebbe rifiutato
+    (invalid_grant) e segnerebbe il token come da riconnettere. La rilettura scarta i token che un
+    altro processo ha rinnovato tra la ricerca e la presa del lease.
+    """
+    if not tokens:
+        return []
+
+    now = datetime.utcnow()
+    claimed = (await db.scalars(update(SocialToken).filter(
+        SocialToken.id.in_([token.id for token in tokens]),
+        or_(
+            SocialToken.refresh_locked_at.is_(None),
+            SocialToken.refresh_locked_at < now - timedelta(seconds=TOKEN_REFRESH_LEASE)
+        )
+    ).values(refresh_locked_at=now).returning(SocialToken.id).execution_options(synchronize_session=False))).all()
+    await db.commit()
+    if not claimed:
+        return []
+
+    return (await db.scalars(select(SocialToken).filter(
+        SocialToken.id.in_(claimed),
+        SocialToken.expires_at <= until,
+        SocialToken.is_active == True,
+        SocialToken.refresh_failed_at.is_(None)
+    ).order_by(SocialToken.expires_at, SocialToken.id).execution_options(populate_existing=True))).all()
+
+async def request_token_refresh(client: httpx.AsyncClient, token: SocialToken) -> Dict[str, Any]:
+    """Chiede un nuovo token al token_url della piattaforma"""
+    config = OAUTH_CONFIGS.get(token.platform)
+    if config is None:
+        raise TokenRefreshError(f"Platform {token.platform} not supported", permanent=True)
+
+    try:
+        if token.platform in GRAPH_PLATFORMS:
+            response = await client.get(config["token_url"], params={
+                "grant_type": "fb_exchange_token",
+                "client_id": config["client_id"],
+                "client_secret": config["client_secret"],
+                "fb_exchange_token": token.access_token
+            })
+        else:
+            refresh_data = {
+                "grant_type": "refresh_token",
+                "refresh_token": token.refresh_token,
+                "client_id": config["client_id"],
+                "client_secret": config["client_secret"]
+            }
+            if token.platform == "tiktok":
+                refresh_data["client_key"] = config["client_id"]
+            response = await client.post(config["token_url"], data=refresh_data)
+    except httpx.TransportError as e:
+        raise TokenRefreshError(f"Token endpoint unreachable: {e}", permanent=False)
+
+    # 4xx (invalid_grant, token revocato): il refresh non potrà mai riuscire
+    if response.is_error:
+        raise TokenRefreshError(
+            f"Token refresh failed with status {response.status_code}: {response.text[:200]}",
+            permanent=response.status_code < 500 and response.status_code != 429
+        )
+
+    token_response = response.json()
+    # TikTok restituisce i dati del token dentro "data"
+    if "access_token" not in token_response and isinstance(token_response.get("data"), dict):
+        token_response = token_response["data"]
+    if not token_response.get("access_token"):
+        raise TokenRefreshError("No access token received", permanent=True)
+
+    return token_response
+
+async def refresh_token(client: httpx.AsyncClient, token: SocialToken, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """Rinnova un token e restituisce i valori da salvare sulla riga"""
+    async with semaphore:
+        token_response = await request_token_refresh(client, token)
+
+    expires_in = token_response.get("expires_in")
+    return {
+        "access_token": token_response["access_token"],
+        # Le piattaforme che non ruotano il refresh token non lo restituiscono
+        "refresh_token": token_response.get("refresh_token") or token.refresh_token,
+        "token_type": token_response.get("token_type", token.token_type),
+        "expires_at": datetime.utcnow() + timedelta(seconds=int(expires_in)) if expires_in else None,
+        "refresh_failed_at": None,
+        "refresh_error": None
+    }
+
+async def refresh_expiring_tokens(
+    db: AsyncSession,
+    client: httpx.AsyncClient,
+    until: datetime,
+    limit: int,
+    concurrency: int,
+    after: Optional[Tuple[datetime, int]] = None
+) -> Tuple[Dict[str, int], Optional[Tuple[datetime, int]]]:
+    """Rinnova un batch di token in scadenza e salva gli esiti; restituisce i conteggi e la posizione dell'ultimo token.
+
+    Le chiamate agli endpoint OAuth sono concorrenti (al massimo concurrency alla volta); gli
+    aggiornamenti sono condizionati sul vecchio access token, così una nuova connessione fatta
+    nel frattempo dall'utente non viene sovrascritta.
+    """
+    candidates = await load_expiring_tokens(db, until, limit, after)
+    last = (candidates[-1].expires_at, candidates[-1].id) if candidates else None
+    tokens = await claim_tokens(db, candidates, until)
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes = await asyncio.gather(
+        *(refresh_token(client, token, semaphore) for token in tokens),
+        return_exceptions=True
+    )
+
+    # I token presi da un altro processo o già rinnovati contano come "skipped" per la paginazione
+    counts = {"refreshed": 0, "failed": 0, "retry": 0, "skipped": len(candidates) - len(tokens)}
+    updated_users = set()
+    for token, outcome in zip(tokens, outcomes):
+        if isinstance(outcome, BaseException) and not (isinstance(outcome, TokenRefreshError) and outcome.permanent):
+            logger.warning("Token %s refresh failed, retrying later: %s", token.id, outcome)
+            counts["retry"] += 1
+            continue
+
+        if isinstance(outcome, TokenRefreshError):
+            # Il token viene segnalato: create_post lo rifiuta finché l'utente non si riconnette
+            logger.warning("Token %s cannot be refreshed: %s", token.id, outcome)
+            values = {"refresh_failed_at": datetime.utcnow(), "refresh_error": str(outcome)}
+            counts["failed"] += 1
+        else:
+            values = outcome
+            counts["refreshed"] += 1
+
+        updated = await db.execute(update(SocialToken).filter(
+            SocialToken.id == token.id,
+            SocialToken.access_token == token.access_token
+        ).values(updated_at=datetime.utcnow(), **values))
+
+        if updated.rowcount:
+            updated_users.add(token.user_id)
+            if "access_token" in values:
+                invalidate_token_caches(token.access_token)
+            update_connected_account(
+                token.user_id,
+                token.platform,
+                **{key: value for key, value in values.items() if key != "refresh_error"}
+            )
+
+    # Rilascia il lease anche dei token da riprovare, che il prossimo giro può riprendere subito
+    if tokens:
+        await db.execute(update(SocialToken).filter(
+            SocialToken.id.in_([token.id for token in tokens])
+        ).values(refresh_locked_at=None).execution_options(synchronize_session=False))
+    await bump_data_version(db, *updated_users)
+    await db.commit()
+    return counts, last
+
+class TokenRefresher:
+    """Task in background che rinnova i token OAuth prima della scadenza"""
+
+    def __init__(self, interval: float, window: float, batch_size: int, concurrency: int):
+        self.interval = interval
+        self.window = window
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def refresh_due(self) -> Dict[str, int]:
+        """Rinnova a batch tutti i token in scadenza nella finestra"""
+        totals = {"refreshed": 0, "failed": 0, "retry": 0, "skipped": 0}
+        until = datetime.utcnow() + timedelta(seconds=self.window)
+        after = None
+
+        while True:
+            async with AsyncSessionLocal() as db:
+                counts, after = await refresh_expiring_tokens(
+                    db, get_http_client(), until, self.batch_size, self.concurrency, after
+                )
+            for key, value in counts.items():
+                totals[key] += value
+            if sum(counts.values()) < self.batch_size:
+                break
+
+        if totals["refreshed"] or totals["failed"]:
+            logger.info("Token refresh: %(refreshed)d refreshed, %(failed)d failed, %(retry)d to retry, %(skipped)d skipped", totals)
+        return totals
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh_due()
+            except Exception:
+                logger.exception("Token refresh iteration failed")
+            await asyncio.sleep(self.interval)
+
+token_refresher = TokenRefresher(
+    interval=TOKEN_REFRESH_INTERVAL,
+    window=TOKEN_REFRESH_WINDOW,
+    batch_size=TOKEN_REFRESH_BATCH_SIZE,
+    concurrency=TOKEN_REFRESH_CONCURRENCY
+)
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import hashlib
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Durata della cache degli account risolti sulle piattaforme (secondi)
+PLATFORM_ACCOUNT_CACHE_TTL = float(os.getenv("PLATFORM_ACCOUNT_CACHE_TTL", "3600"))
+PLATFORM_ACCOUNT_CACHE_SIZE = int(os.getenv("PLATFORM_ACCOUNT_CACHE_SIZE", "10000"))
+
+# Cache degli utenti autenticati per token JWT (la scadenza non supera mai quella del token)
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+class TTLCache:
+    """Cache in memoria con scadenza (TTL) e dimensione massima, con eviction LRU.
+
+    Con max_bytes e weigh il limite è anche sulla memoria stimata delle voci.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = 10000,
+        max_bytes: Optional[int] = None,
+        weigh: Optional[Callable[[Any], int]] = None
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.weigh = weigh
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._weights: Dict[Hashable, int] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if key in self._data:
+            self.pop(key)
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+        if self.weigh is not None:
+            weight = self.weigh(value)
+            self._weights[key] = weight
+            self.total_bytes += weight
+
+        # Rimuove le voci usate meno di recente oltre la dimensione (o la memoria) massima
+        while len(self._data) > self.maxsize or (
+            self.max_bytes is not None and self.total_bytes > self.max_bytes and len(self._data) > 1
+        ):
+            self.pop(next(iter(self._data)))
+
+    def pop(self, key: Hashable) -> Any:
+        item = self._data.pop(key, None)
+        self.total_bytes -= self._weights.pop(key, 0)
+        return item[1] if item is not None else None
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._weights.clear()
+        self.total_bytes = 0
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Voci non scadute, senza aggiornare l'ordine LRU né i contatori"""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in list(self._data.items()) if expires_at > now]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori di utilizzo della cache, per il monitoraggio"""
+        stats = {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+        if self.max_bytes is not None:
+            stats.update({"bytes": self.total_bytes, "max_bytes": self.max_bytes})
+        return stats
+
+def token_fingerprint(token: str) -> str:
+    """Identità stabile di un token da usare come chiave di cache, senza conservare il token in chiaro"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+# Pagine Facebook, account Instagram Business e autori LinkedIn risolti per token di accesso
+platform_account_cache = TTLCache(ttl=PLATFORM_ACCOUNT_CACHE_TTL, maxsize=PLATFORM_ACCOUNT_CACHE_SIZE)
+
+# Utenti autenticati per impronta del token JWT
+principal_cache = TTLCache(ttl=PRINCIPAL_CACHE_TTL, maxsize=PRINCIPAL_CACHE_SIZE)
+
+# Generazione per utente, incrementata alla disattivazione: invalida in O(1) tutte le voci precedenti
+_principal_generations: Dict[int, int] = {}
+
+def get_principal_generation(user_id: int) -> int:
+    return _principal_generations.get(user_id, 0)
+
+def invalidate_user_principals(user_id: int) -> None:
+    """Invalida gli utenti autenticati in cache per tutti i token di un utente"""
+    _principal_generations[user_id] = _principal_generations.get(user_id, 0) + 1
+
+def invalidate_token_caches(access_token: Optional[str]) -> None:
+    """Rimuove dalle cache tutti i dati derivati da un token di accesso (refresh o disconnessione)"""
+    if not access_token:
+        return
+
+    fingerprint = token_fingerprint(access_token)
+    for kind in ("facebook_page", "instagram_account", "linkedin_author"):
+        platform_account_cache.pop((kind, fingerprint))
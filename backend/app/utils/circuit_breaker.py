@@ -0,0 +1,120 @@
+from typing import Any, Dict
+import logging
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Errori consecutivi che aprono il circuito di una piattaforma
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Tempo in cui il circuito resta aperto prima di provare una chiamata di verifica (secondi)
+CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30"))
+# Chiamate di verifica ammesse contemporaneamente nello stato half-open
+CIRCUIT_HALF_OPEN_MAX_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_MAX_CALLS", "1"))
+
+class CircuitOpenError(Exception):
+    """La piattaforma è considerata non disponibile: la chiamata fallisce subito"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Circuit breaker closed / open / half-open sugli errori consecutivi di una piattaforma.
+
+    Da aperto, dopo recovery_timeout lascia passare al massimo half_open_max_calls chiamate di
+    verifica: un successo lo richiude, un errore lo riapre. Una verifica che non termina (es.
+    cancellata dal timeout di pubblicazione) libera il posto dopo recovery_timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float, half_open_max_calls: int):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes: Dict[int, float] = {}
+        self._probe_id = 0
+        self.total_failures = 0
+        self.rejected = 0
+
+    def before_call(self) -> None:
+        """Verifica se una chiamata può partire, altrimenti solleva CircuitOpenError"""
+        if self.state == "closed":
+            return
+
+        now = time.monotonic()
+        if self.state == "open":
+            retry_after = self.opened_at + self.recovery_timeout - now
+            if retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, retry_after)
+            self.state = "half_open"
+            self._probes.clear()
+
+        # Half-open: solo un numero limitato di chiamate di verifica alla volta
+        self._probes = {probe: started for probe, started in self._probes.items() if now - started < self.recovery_timeout}
+        if len(self._probes) >= self.half_open_max_calls:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.recovery_timeout)
+        self._probe_id += 1
+        self._probes[self._probe_id] = now
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info("Circuit for %s closed", self.name)
+        self.state = "closed"
+        self.failures = 0
+        self._probes.clear()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.total_failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            if self.state == "closed":
+                logger.warning("Circuit for %s opened after %d consecutive failures", self.name, self.failures)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        retry_after = max(self.opened_at + self.recovery_timeout - time.monotonic(), 0) if self.state == "open" else 0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "total_failures": self.total_failures,
+            "rejected": self.rejected,
+            "retry_after": round(retry_after, 2)
+        }
+
+class CircuitBreakerRegistry:
+    """Un circuit breaker per nome (piattaforma), creato al primo utilizzo"""
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float, half_open_max_calls: int):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(
+                name, self.failure_threshold, self.recovery_timeout, self.half_open_max_calls
+            )
+        return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+circuit_breakers = CircuitBreakerRegistry(
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    recovery_timeout=CIRCUIT_RECOVERY_TIMEOUT,
+    half_open_max_calls=CIRCUIT_HALF_OPEN_MAX_CALLS
+)
@@ -1,10 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 
+from utils.metrics import password_hash_duration, password_hash_queue_wait
+
 load_dotenv()
 
 # Configurazione JWT
@@ -13,7 +18,14 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
 # Configurazione per l'hashing delle password
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Thread dedicati a bcrypt: limitano i core usati da un picco di login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt rilascia il GIL: i thread del pool lavorano in parallelo senza bloccare l'event loop
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica se la password in chiaro corrisponde a quella hashata"""
@@ -23,6 +35,33 @@ def get_password_hash(password: str) -> str:
     """Genera l'hash della password"""
     return pwd_context.hash(password)
 
+async def _run_password_job(operation: str, func, *args):
+    """Esegue una funzione bcrypt nel pool dedicato misurando attesa in coda e durata"""
+    loop = asyncio.get_running_loop()
+    submitted_at = time.perf_counter()
+
+    def timed():
+        started_at = time.perf_counter()
+        return func(*args), started_at, time.perf_counter()
+
+    result, started_at, finished_at = await loop.run_in_executor(_password_executor, timed)
+    # Le metriche vengono registrate dall'event loop, non dai thread del pool
+    password_hash_queue_wait.observe(started_at - submitted_at, operation)
+    password_hash_duration.observe(finished_at - started_at, operation)
+    return result
+
+async def get_password_hash_async(password: str) -> str:
+    """Genera l'hash della password nel pool dedicato, senza bloccare l'event loop"""
+    return await _run_password_job("hash", pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica la password nel pool dedicato.
+
+    Restituisce anche un nuovo hash quando quello salvato è obsoleto (es. costo bcrypt
+    aumentato tramite BCRYPT_ROUNDS), da salvare al posto del precedente.
+    """
+    return await _run_password_job("verify", pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Crea un token JWT di accesso"""
     to_encode = data.copy()
@@ -49,9 +88,14 @@ def get_user_from_token(token: str) -> Optional[dict]:
     if payload is None:
         return None
     
-    user_id: int = payload.get("sub")
+    user_id = payload.get("sub")
     if user_id is None:
         return None
     
-    return {"user_id": user_id, "email": payload.get("email"), "username": payload.get("username")}
+    return {
+        "user_id": int(user_id),
+        "email": payload.get("email"),
+        "username": payload.get("username"),
+        "exp": payload.get("exp")
+    }
 
@@ -0,0 +1,193 @@
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Bucket di latenza in secondi, dalle query veloci alle chiamate lente verso le piattaforme
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    """Contatore monotono con etichette.
+
+    Le metriche vengono aggiornate dall'event loop senza lock: un incremento è un'operazione
+    su un dizionario, trascurabile rispetto al lavoro misurato.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Istogramma con bucket fissi ed etichette, nel formato Prometheus.
+
+    Ogni osservazione incrementa un solo bucket (ricerca binaria); i conteggi cumulativi
+    vengono calcolati solo quando /metrics viene letto.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per ogni serie: conteggi per bucket, +Inf, somma, numero di osservazioni
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(series[-1])}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Testo in formato di esposizione Prometheus per /metrics"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")
+)
+publish_duration = registry.histogram(
+    "publish_duration_seconds", "Latency of publishing to a platform by outcome", ("platform", "outcome")
+)
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "SQL statement execution time by statement type", ("operation",)
+)
+db_query_errors = registry.counter(
+    "db_query_errors_total", "SQL statements that raised an error", ("operation",)
+)
+db_pool_checkout_duration = registry.histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a database connection from the pool"
+)
+password_hash_duration = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt hashing and verification time", ("operation",)
+)
+password_hash_queue_wait = registry.histogram(
+    "password_hash_queue_wait_seconds", "Time bcrypt jobs wait for a free worker thread", ("operation",)
+)
+
+def _statement_operation(statement: str) -> str:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+def instrument_engine(engine: Engine) -> None:
+    """Misura durata ed errori delle query di un engine (per l'engine asincrono: async_engine.sync_engine)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started_at = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_at = getattr(context, "_metrics_started_at", None)
+        if started_at is not None:
+            db_query_duration.observe(time.perf_counter() - started_at, _statement_operation(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        db_query_errors.inc(_statement_operation(exception_context.statement or ""))
+
+def instrument_sessions() -> None:
+    """Misura l'attesa della connessione: tra l'inizio della transazione della sessione e il BEGIN sulla connessione"""
+
+    @event.listens_for(Session, "after_transaction_create")
+    def after_transaction_create(session, transaction):
+        if transaction.parent is None:
+            session.info["_metrics_checkout_started_at"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_begin")
+    def after_begin(session, transaction, connection):
+        started_at = session.info.pop("_metrics_checkout_started_at", None)
+        if started_at is not None:
+            db_pool_checkout_duration.observe(time.perf_counter() - started_at)
+
+class MetricsMiddleware:
+    """Middleware ASGI che misura la latenza delle richieste per template di rotta.
+
+    Si usa il template (es. /posts/{post_id}/status) e non il path, per non creare una serie per ogni ID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started_at,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code)
+            )
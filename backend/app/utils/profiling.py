@@ -0,0 +1,213 @@
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Profiling per richiesta: con PROFILING_ENABLED si attiva con l'header X-Profile: 1
+# oppure su una frazione casuale delle richieste (PROFILING_SAMPLE_RATE, da 0 a 1)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+# Se impostato, l'header deve contenere questo valore invece di "1"
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+# Intervallo di campionamento dello stack dell'event loop (secondi)
+PROFILING_SAMPLE_INTERVAL = float(os.getenv("PROFILING_SAMPLE_INTERVAL", "0.005"))
+# Query più lente e funzioni più campionate riportate nel log
+PROFILING_TOP = int(os.getenv("PROFILING_TOP", "5"))
+# Esecuzioni della stessa query in una richiesta oltre le quali si segnala un probabile N+1
+PROFILING_REPEAT_THRESHOLD = int(os.getenv("PROFILING_REPEAT_THRESHOLD", "5"))
+# File locale in cui scrivere i profili (vuoto: solo il logging dell'applicazione)
+PROFILING_LOG_FILE = os.getenv("PROFILING_LOG_FILE", "profiling.log")
+
+if PROFILING_ENABLED and PROFILING_LOG_FILE:
+    _file_handler = logging.FileHandler(PROFILING_LOG_FILE)
+    _file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    logger.addHandler(_file_handler)
+    logger.setLevel(logging.INFO)
+
+PROFILE_HEADER = "x-profile"
+
+# Directory dell'applicazione: nel riepilogo del profiler contano le funzioni del nostro codice
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_WHITESPACE = re.compile(r"\s+")
+
+class RequestProfile:
+    """Query SQL e campioni dello stack raccolti durante una richiesta profilata"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0.0
+        self.queries: List[Tuple[float, str]] = []
+        self.statement_counts: Dict[str, int] = {}
+        self.samples: Dict[str, int] = {}
+        self.app_samples: Dict[str, int] = {}
+        self.sample_count = 0
+
+    def record_query(self, statement: str, elapsed: float) -> None:
+        statement = _WHITESPACE.sub(" ", statement).strip()
+        self.query_count += 1
+        self.query_time += elapsed
+        self.queries.append((elapsed, statement))
+        self.statement_counts[statement] = self.statement_counts.get(statement, 0) + 1
+
+    def slowest_queries(self, limit: int) -> List[Tuple[float, str]]:
+        return sorted(self.queries, reverse=True)[:limit]
+
+    def repeated_queries(self, threshold: int) -> List[Tuple[int, str]]:
+        """Query eseguite più volte con lo stesso testo: di solito un accesso lazy in un ciclo"""
+        return sorted(
+            ((count, statement) for statement, count in self.statement_counts.items() if count >= threshold),
+            reverse=True
+        )
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+def profile_engine(engine: Engine) -> None:
+    """Conta le query della richiesta profilata in corso (per l'engine asincrono: async_engine.sync_engine)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            context._profile_started_at = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        started_at = getattr(context, "_profile_started_at", None)
+        if profile is not None and started_at is not None:
+            profile.record_query(statement, time.perf_counter() - started_at)
+
+class StackSampler:
+    """Campiona a intervalli regolari lo stack del thread dell'event loop.
+
+    Le altre richieste servite nello stesso momento finiscono nei campioni: con un solo
+    profilo attivo alla volta il riepilogo resta comunque rappresentativo.
+    """
+
+    def __init__(self, profile: RequestProfile, thread_id: int, interval: float):
+        self.profile = profile
+        self.thread_id = thread_id
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.profile.sample_count += 1
+            leaf = _frame_label(frame)
+            self.profile.samples[leaf] = self.profile.samples.get(leaf, 0) + 1
+
+            # Tempo cumulativo per funzione dell'applicazione (una volta per campione)
+            seen = set()
+            while frame is not None:
+                if frame.f_code.co_filename.startswith(APP_ROOT):
+                    label = _frame_label(frame)
+                    if label not in seen:
+                        seen.add(label)
+                        self.profile.app_samples[label] = self.profile.app_samples.get(label, 0) + 1
+                frame = frame.f_back
+
+def _frame_label(frame) -> str:
+    filename = frame.f_code.co_filename
+    if filename.startswith(APP_ROOT):
+        filename = os.path.relpath(filename, APP_ROOT)
+    return f"{frame.f_code.co_name} ({filename}:{frame.f_code.co_firstlineno})"
+
+def _top(counts: Dict[str, int], limit: int) -> List[Tuple[int, str]]:
+    return sorted(((count, label) for label, count in counts.items()), reverse=True)[:limit]
+
+def should_profile(scope) -> bool:
+    if not PROFILING_ENABLED:
+        return False
+    for name, value in scope.get("headers", []):
+        if name == PROFILE_HEADER.encode():
+            return value.decode("latin-1") == (PROFILING_SECRET or "1")
+    return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+def log_profile(method: str, path: str, status_code: int, elapsed: float, profile: RequestProfile) -> None:
+    lines = [
+        "Profile %s %s -> %d in %.1fms: %d queries in %.1fms" % (
+            method, path, status_code, elapsed * 1000, profile.query_count, profile.query_time * 1000
+        )
+    ]
+    for query_elapsed, statement in profile.slowest_queries(PROFILING_TOP):
+        lines.append("  slow query %.2fms: %s" % (query_elapsed * 1000, statement[:300]))
+    for count, statement in profile.repeated_queries(PROFILING_REPEAT_THRESHOLD):
+        lines.append("  repeated %dx (possible N+1): %s" % (count, statement[:300]))
+    if profile.sample_count:
+        for count, label in _top(profile.app_samples, PROFILING_TOP):
+            lines.append("  app %5.1f%% %s" % (100 * count / profile.sample_count, label))
+        for count, label in _top(profile.samples, PROFILING_TOP):
+            lines.append("  self %5.1f%% %s" % (100 * count / profile.sample_count, label))
+
+    if profile.repeated_queries(PROFILING_REPEAT_THRESHOLD):
+        logger.warning("\n".join(lines))
+    else:
+        logger.info("\n".join(lines))
+
+class ProfilingMiddleware:
+    """Middleware ASGI che profila le richieste selezionate da should_profile.
+
+    Aggiunge alla risposta X-Query-Count e Server-Timing (tempo SQL e totale); query lente,
+    query ripetute e riepilogo del profiler vanno nel log.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        reset_token = _current_profile.set(profile)
+        sampler = StackSampler(profile, threading.get_ident(), PROFILING_SAMPLE_INTERVAL)
+        sampler.start()
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed = time.perf_counter() - started_at
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(profile.query_count).encode()))
+                headers.append((b"server-timing", (
+                    'db;dur=%.1f;desc="%d queries", app;dur=%.1f' % (
+                        profile.query_time * 1000, profile.query_count, elapsed * 1000
+                    )
+                ).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _current_profile.reset(reset_token)
+            log_profile(scope["method"], scope["path"], status_code, time.perf_counter() - started_at, profile)
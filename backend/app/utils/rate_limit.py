@@ -0,0 +1,284 @@
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+import asyncio
+import httpx
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+from utils.cache import TTLCache
+
+load_dotenv()
+
+# Limiti di default come "richieste/secondi": per account (token) e complessivo dell'app sulla piattaforma.
+# Si possono sovrascrivere con RATE_LIMIT_<PIATTAFORMA>_ACCOUNT e RATE_LIMIT_<PIATTAFORMA>_APP ("none" per disattivarli)
+DEFAULT_RATE_LIMITS = {
+    "facebook": ("200/3600", None),
+    "instagram": ("200/3600", None),
+    "linkedin": ("150/86400", "100000/86400"),
+    "twitter": ("100/900", "10000/86400"),
+    "tiktok": ("6/60", None),
+}
+# Attesa massima in coda al limiter prima di rinunciare e riprogrammare la pubblicazione (secondi)
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+# Pausa applicata a un 429 senza Retry-After né header di reset (secondi)
+RATE_LIMIT_DEFAULT_BACKOFF = float(os.getenv("RATE_LIMIT_DEFAULT_BACKOFF", "60"))
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+
+# Codici di errore della Graph API per il superamento dei limiti (4: app, 17: utente, 32: pagina, 613: generico)
+GRAPH_RATE_LIMIT_CODES = {4, 17, 32, 613}
+GRAPH_PLATFORMS = ("facebook", "instagram")
+
+class RateLimitedError(Exception):
+    """Il limite della piattaforma non permette la chiamata entro l'attesa massima"""
+
+    def __init__(self, platform: str, retry_after: float):
+        super().__init__(f"Rate limit reached on {platform}, retry in {retry_after:.0f}s")
+        self.platform = platform
+        self.retry_after = retry_after
+
+def parse_limit(spec: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Converte "100/900" in (capacità, secondi); None o "none" indicano nessun limite"""
+    if not spec or spec.lower() == "none":
+        return None
+    requests, seconds = spec.split("/")
+    return float(requests), float(seconds)
+
+def get_rate_limits(platform: str) -> Tuple[Optional[Tuple[float, float]], Optional[Tuple[float, float]]]:
+    account_default, app_default = DEFAULT_RATE_LIMITS.get(platform, (None, None))
+    prefix = f"RATE_LIMIT_{platform.upper()}"
+    return (
+        parse_limit(os.getenv(f"{prefix}_ACCOUNT", account_default)),
+        parse_limit(os.getenv(f"{prefix}_APP", app_default))
+    )
+
+class TokenBucket:
+    """Token bucket con blocco temporaneo imposto dalla piattaforma (Retry-After, reset della finestra).
+
+    Senza limite configurato il bucket non conta le richieste ma rispetta comunque i blocchi.
+    """
+
+    def __init__(self, limit: Optional[Tuple[float, float]]):
+        self.capacity = limit[0] if limit else None
+        self.rate = limit[0] / limit[1] if limit else None
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = 0
+
+    def _refill(self, now: float) -> None:
+        if self.capacity is None:
+            return
+        # Durante un blocco i token non si ricaricano
+        start = max(self.updated, self.blocked_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = max(now, self.updated)
+
+    def wait_time(self) -> float:
+        """Secondi da attendere prima che una richiesta sia permessa"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(self.blocked_until - now, 0)
+        if self.capacity is not None and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self) -> None:
+        if self.capacity is not None:
+            self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """Blocca il bucket per il tempo indicato dalla piattaforma"""
+        now = time.monotonic()
+        self._refill(now)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def sync_remaining(self, remaining: int, reset_in: Optional[float]) -> None:
+        """Allinea i token a quelli che la piattaforma dichiara ancora disponibili nella finestra"""
+        if remaining <= 0:
+            self.block(reset_in if reset_in is not None else RATE_LIMIT_DEFAULT_BACKOFF)
+        elif self.capacity is not None:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, float(remaining))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokens": round(self.tokens, 2) if self.capacity is not None else None,
+            "capacity": self.capacity,
+            "refill_per_second": self.rate,
+            "blocked_for": round(max(self.blocked_until - time.monotonic(), 0), 2),
+            "waiting": self.waiting
+        }
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Legge Retry-After espresso in secondi o come data HTTP"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Secondi al reset della finestra: Twitter usa un timestamp epoch, altri header un intervallo"""
+    if not value:
+        return None
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1_000_000_000:
+        reset -= time.time()
+    return max(reset, 0)
+
+def _first_header(headers: httpx.Headers, names: Tuple[str, ...]) -> Optional[str]:
+    for name in names:
+        if name in headers:
+            return headers[name]
+    return None
+
+def _graph_usage(value: Optional[str]) -> Tuple[float, Optional[float]]:
+    """Percentuale massima di utilizzo e minuti al ripristino da X-App-Usage / X-Business-Use-Case-Usage"""
+    if not value:
+        return 0, None
+    try:
+        usage = json.loads(value)
+    except ValueError:
+        return 0, None
+    if not isinstance(usage, dict):
+        return 0, None
+
+    # X-App-Usage è un oggetto singolo, X-Business-Use-Case-Usage una lista per ID di business
+    if "call_count" in usage:
+        entries = [usage]
+    else:
+        entries = [entry for values in usage.values() if isinstance(values, list) for entry in values if isinstance(entry, dict)]
+    percent, regain = 0.0, None
+    for entry in entries:
+        percent = max(percent, *(float(entry.get(key, 0)) for key in ("call_count", "total_time", "total_cputime")))
+        if entry.get("estimated_time_to_regain_access"):
+            regain = max(regain or 0, float(entry["estimated_time_to_regain_access"]))
+    return percent, regain
+
+def graph_rate_limit_code(response: httpx.Response) -> Optional[int]:
+    """Codice di errore della Graph API se la risposta indica un limite superato"""
+    if not response.is_error:
+        return None
+    try:
+        code = response.json().get("error", {}).get("code")
+    except ValueError:
+        return None
+    return code if code in GRAPH_RATE_LIMIT_CODES else None
+
+class RateLimiter:
+    """Limiter per piattaforma e per account davanti a ogni chiamata degli adapter di pubblicazione"""
+
+    def __init__(self, max_wait: float, max_buckets: int):
+        self.max_wait = max_wait
+        self._platform_buckets: Dict[str, TokenBucket] = {}
+        # I bucket degli account inattivi vengono scartati dopo un giorno o oltre la dimensione massima
+        self._account_buckets = TTLCache(ttl=86400, maxsize=max_buckets)
+
+    def _buckets(self, platform: str, account: str) -> Tuple[TokenBucket, TokenBucket]:
+        account_limit, app_limit = get_rate_limits(platform)
+
+        platform_bucket = self._platform_buckets.get(platform)
+        if platform_bucket is None:
+            platform_bucket = self._platform_buckets[platform] = TokenBucket(app_limit)
+
+        account_bucket = self._account_buckets.get((platform, account))
+        if account_bucket is None:
+            account_bucket = TokenBucket(account_limit)
+        # Ogni utilizzo rinnova la scadenza del bucket
+        self._account_buckets.set((platform, account), account_bucket)
+
+        return platform_bucket, account_bucket
+
+    async def acquire(self, platform: str, account: str) -> float:
+        """Attende il proprio turno sui bucket della piattaforma e dell'account.
+
+        Restituisce i secondi attesi; se l'attesa supererebbe max_wait solleva RateLimitedError.
+        """
+        buckets = self._buckets(platform, account)
+        waited = 0.0
+
+        while True:
+            wait = max(bucket.wait_time() for bucket in buckets)
+            if wait <= 0:
+                for bucket in buckets:
+                    bucket.consume()
+                return waited
+
+            if waited + wait > self.max_wait:
+                raise RateLimitedError(platform, wait)
+
+            for bucket in buckets:
+                bucket.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                for bucket in buckets:
+                    bucket.waiting -= 1
+            waited += wait
+
+    def observe(self, platform: str, account: str, response: httpx.Response) -> Optional[float]:
+        """Adatta i bucket agli header di una risposta.
+
+        Se la piattaforma ha rifiutato la chiamata per limite superato restituisce i secondi
+        da attendere prima di riprovare, altrimenti None.
+        """
+        platform_bucket, account_bucket = self._buckets(platform, account)
+        headers = response.headers
+
+        # Header di Twitter e header standard: richieste rimaste e reset della finestra
+        remaining = _first_header(headers, ("x-rate-limit-remaining", "x-ratelimit-remaining", "ratelimit-remaining"))
+        if remaining is not None and remaining.strip().lstrip("-").isdigit():
+            reset_in = parse_reset(_first_header(headers, ("x-rate-limit-reset", "x-ratelimit-reset", "ratelimit-reset")))
+            account_bucket.sync_remaining(int(remaining), reset_in)
+
+        graph_code = None
+        if platform in GRAPH_PLATFORMS:
+            # La Graph API non usa 429: comunica l'utilizzo in percentuale e blocca al 100%
+            app_percent, app_regain = _graph_usage(headers.get("x-app-usage"))
+            if app_percent >= 100:
+                platform_bucket.block(app_regain * 60 if app_regain else RATE_LIMIT_DEFAULT_BACKOFF)
+            account_percent, account_regain = _graph_usage(headers.get("x-business-use-case-usage"))
+            if account_percent >= 100:
+                account_bucket.block(account_regain * 60 if account_regain else RATE_LIMIT_DEFAULT_BACKOFF)
+            graph_code = graph_rate_limit_code(response)
+
+        if response.status_code != 429 and graph_code is None:
+            return None
+
+        retry_after = parse_retry_after(headers.get("retry-after"))
+        bucket = platform_bucket if graph_code == 4 else account_bucket
+        if retry_after is not None:
+            bucket.block(retry_after)
+        elif bucket.wait_time() <= 0:
+            bucket.block(RATE_LIMIT_DEFAULT_BACKOFF)
+
+        return bucket.wait_time()
+
+    def stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Stato corrente dei bucket, per il monitoraggio (l'account è un prefisso dell'impronta del token)"""
+        platforms = [
+            {"platform": platform, **bucket.stats()}
+            for platform, bucket in self._platform_buckets.items()
+        ]
+        accounts = [
+            {"platform": platform, "account": account[:12], **bucket.stats()}
+            for (platform, account), bucket in self._account_buckets.items()
+        ]
+        return {"platforms": platforms, "accounts": accounts}
+
+rate_limiter = RateLimiter(max_wait=RATE_LIMIT_MAX_WAIT, max_buckets=RATE_LIMIT_MAX_BUCKETS)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Ricostruisce la tabella publish_stats_daily dallo storico di post_results.
+
+Le statistiche vengono ricalcolate con un GROUP BY per utente, piattaforma e giorno e
+sostituiscono quelle esistenti in un'unica transazione. Da eseguire dopo l'introduzione
+del rollup o per correggerlo, con i worker di pubblicazione fermi.
+
+Uso: python backfill_publish_stats.py [--user-id 42]
+"""
+
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+
+# Aggiungi la directory app al path Python
+app_dir = Path(__file__).parent / "app"
+sys.path.insert(0, str(app_dir))
+
+from sqlalchemy import Date, case, cast, delete, func, insert, select
+
+from db.database import SessionLocal, create_tables, engine
+from models.models import Post, PostResult, PublishStatsDaily
+
+def backfill(user_id=None) -> int:
+    # Giorno UTC della creazione del risultato, come il rollup in tempo reale (datetime.utcnow().date()).
+    # SQLite non ha un vero tipo DATE; su PostgreSQL created_at è timestamptz e il cast diretto
+    # userebbe il fuso della sessione, quindi il valore viene prima convertito in UTC
+    if engine.dialect.name == "sqlite":
+        day = func.date(PostResult.created_at)
+    elif engine.dialect.name == "postgresql":
+        day = cast(func.timezone("UTC", PostResult.created_at), Date)
+    else:
+        day = cast(PostResult.created_at, Date)
+
+    query = select(
+        Post.user_id,
+        day.label("day"),
+        PostResult.platform,
+        func.sum(case((PostResult.status == "success", 1), else_=0)),
+        func.sum(case((PostResult.status == "success", 0), else_=1)),
+        func.count(PostResult.latency_ms),
+        func.coalesce(func.sum(PostResult.latency_ms), 0),
+        func.coalesce(func.max(PostResult.latency_ms), 0)
+    ).join(Post, Post.id == PostResult.post_id).group_by(Post.user_id, day, PostResult.platform)
+
+    clear = delete(PublishStatsDaily)
+    if user_id is not None:
+        query = query.filter(Post.user_id == user_id)
+        clear = clear.filter(PublishStatsDaily.user_id == user_id)
+
+    with SessionLocal() as db:
+        rows = [
+            {
+                "user_id": row[0],
+                "day": date.fromisoformat(row[1]) if isinstance(row[1], str) else row[1],
+                "platform": row[2],
+                "success_count": row[3],
+                "failure_count": row[4],
+                "latency_count": row[5],
+                "latency_ms_total": row[6],
+                "latency_ms_max": row[7]
+            }
+            for row in db.execute(query)
+        ]
+        db.execute(clear)
+        if rows:
+            db.execute(insert(PublishStatsDaily), rows)
+        db.commit()
+
+    return len(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, help="ricostruisci solo le statistiche di un utente")
+    args = parser.parse_args()
+
+    try:
+        print(f"🔄 Ricostruzione di publish_stats_daily su {engine.url}")
+        # Crea publish_stats_daily e la colonna post_results.latency_ms se mancano
+        create_tables()
+        count = backfill(args.user_id)
+        print(f"✅ {count} righe giornaliere ricostruite")
+    except Exception as e:
+        print(f"❌ Errore durante la ricostruzione: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
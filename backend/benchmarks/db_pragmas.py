@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark del throughput SQLite con la configurazione di default e con i PRAGMA dell'applicazione.
+Più processi scrivono e leggono post sullo stesso file, come più worker uvicorn sullo stesso database.
+
+Uso: python benchmarks/db_pragmas.py [--writers 4] [--readers 4] [--seconds 5]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Aggiungi la directory app al path Python
+app_dir = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(app_dir))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from db.database import Base, apply_sqlite_pragmas, get_engine_options
+from models.models import User, Post
+
+def make_engine(url: str, tuned: bool):
+    """Motore come in db/database.py prima (default) e dopo (tuned) la configurazione"""
+    if not tuned:
+        return create_engine(url, connect_args={"check_same_thread": False})
+    engine = create_engine(url, **get_engine_options(url))
+    apply_sqlite_pragmas(engine)
+    return engine
+
+def worker(url: str, tuned: bool, role: str, seconds: float, results):
+    Session = sessionmaker(bind=make_engine(url, tuned))
+    ops = errors = 0
+    deadline = time.perf_counter() + seconds
+
+    while time.perf_counter() < deadline:
+        try:
+            with Session() as db:
+                if role == "writer":
+                    db.add(Post(user_id=1, content="benchmark", platforms='["facebook"]', status="published"))
+                    db.commit()
+                else:
+                    db.scalars(select(Post).filter(Post.user_id == 1).order_by(
+                        Post.created_at.desc(), Post.id.desc()
+                    ).limit(20)).all()
+            ops += 1
+        except OperationalError:
+            # "database is locked": è l'errore che diventa un 500 nelle rotte
+            errors += 1
+
+    results.put((role, ops, errors))
+
+def run(tuned: bool, writers: int, readers: int, seconds: float) -> dict:
+    directory = tempfile.mkdtemp(prefix="db_pragmas_")
+    url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+
+    engine = make_engine(url, tuned)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(User(email="bench@example.com", username="bench", hashed_password="x"))
+        db.commit()
+    engine.dispose()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(url, tuned, role, seconds, results))
+        for role in ["writer"] * writers + ["reader"] * readers
+    ]
+    for process in processes:
+        process.start()
+    totals = {"writer": [0, 0], "reader": [0, 0]}
+    for _ in processes:
+        role, ops, errors = results.get()
+        totals[role][0] += ops
+        totals[role][1] += errors
+    for process in processes:
+        process.join()
+
+    return {
+        "writes_per_s": totals["writer"][0] / seconds,
+        "write_errors": totals["writer"][1],
+        "reads_per_s": totals["reader"][0] / seconds,
+        "read_errors": totals["reader"][1]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer, {args.readers} reader, {args.seconds:g}s per configurazione\n")
+    print(f"{'configurazione':<16}{'write/s':>10}{'errori':>8}{'read/s':>10}{'errori':>8}")
+    for label, tuned in (("default", False), ("WAL + PRAGMA", True)):
+        stats = run(tuned, args.writers, args.readers, args.seconds)
+        print(f"{label:<16}{stats['writes_per_s']:>10.0f}{stats['write_errors']:>8}{stats['reads_per_s']:>10.0f}{stats['read_errors']:>8}")
+
+if __name__ == "__main__":
+    main()
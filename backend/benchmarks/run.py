@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Benchmark dell'API eseguita in-process (httpx.ASGITransport) con le piattaforme social simulate
+da benchmarks/stubs.py: throughput e latenze p50/p95/p99 di /auth/login, /posts/create e /posts/history.
+Lo scenario create_instagram pubblica un'immagine solo su Instagram, che ha un profilo stub separato
+da Facebook pur usando lo stesso host della Graph API.
+
+Il database è un file SQLite temporaneo popolato con --users utenti e --posts-per-user post ciascuno.
+I risultati si possono salvare come baseline (benchmarks/baselines/<nome>.json) e confrontare
+con una baseline precedente: con --compare il processo termina con codice 1 se una rotta peggiora
+oltre --tolerance.
+
+Uso: python benchmarks/run.py [--concurrency 10] [--requests 200] [--users 20] [--posts-per-user 100]
+                              [--latency 0.1] [--error-rate 0] [--rate-limit-rate 0]
+                              [--override instagram:latency=0.3,rate_limit=25/60]
+                              [--save-baseline default] [--compare default]
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+# Aggiungi la directory app al path Python
+app_dir = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(app_dir))
+
+import httpx
+
+from stubs import PlatformStubs, StubConfig
+
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+SCENARIOS = ("login", "create", "create_instagram", "history")
+# Account collegati per ogni utente, indipendentemente da --platforms: gli scenari possono usarli tutti
+CONNECTED_PLATFORMS = ("facebook", "instagram", "linkedin", "twitter", "tiktok")
+INSTAGRAM_MEDIA_URL = "https://cdn.example.com/benchmark.jpg"
+PASSWORD = "benchmark-password"
+
+def configure_environment(args) -> None:
+    """Variabili d'ambiente dell'applicazione, da impostare prima di importarla"""
+    directory = tempfile.mkdtemp(prefix="benchmark_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ["MEDIA_ROOT"] = os.path.join(directory, "media")
+    os.environ["PUBLISH_MODE"] = args.publish_mode
+    # Nessun task in background oltre ai worker di pubblicazione: misurano solo le richieste
+    os.environ["SCHEDULER_ENABLED"] = "false"
+    os.environ["TOKEN_REFRESH_ENABLED"] = "false"
+    os.environ["PROFILING_ENABLED"] = "false"
+    if not args.app_rate_limits:
+        # I limiti reali (es. 100 tweet ogni 15 minuti) riprogrammerebbero quasi tutte le pubblicazioni
+        for name in ("FACEBOOK", "INSTAGRAM", "LINKEDIN", "TWITTER", "TIKTOK"):
+            os.environ[f"RATE_LIMIT_{name}_ACCOUNT"] = "none"
+            os.environ[f"RATE_LIMIT_{name}_APP"] = "none"
+
+def seed_database(users: int, posts_per_user: int, platforms: List[str]) -> None:
+    """Crea utenti con gli account social collegati e la cronologia dei post"""
+    from sqlalchemy import insert
+
+    from db.database import SessionLocal, create_tables
+    from models.models import Post, PostResult, PostTarget, SocialToken, User
+    from services.post_targets import post_target_rows
+    from utils.jwt import get_password_hash
+
+    create_tables()
+    hashed_password = get_password_hash(PASSWORD)
+    now = datetime.utcnow()
+
+    with SessionLocal() as db:
+        db.execute(insert(User), [
+            {"email": f"bench{i}@example.com", "username": f"bench{i}", "hashed_password": hashed_password}
+            for i in range(users)
+        ])
+        user_ids = [user.id for user in db.query(User).order_by(User.id)]
+        db.execute(insert(SocialToken), [
+            {"user_id": user_id, "platform": name, "access_token": f"token-{user_id}-{name}", "is_active": True}
+            for user_id in user_ids for name in CONNECTED_PLATFORMS
+        ])
+
+        for user_id in user_ids:
+            posts = db.scalars(insert(Post).returning(Post.id), [
+                {
+                    "user_id": user_id,
+                    "content": f"Post di benchmark {i}",
+                    "platforms": json.dumps(platforms),
+                    "status": "published",
+                    "created_at": now - timedelta(minutes=i),
+                    "published_at": now - timedelta(minutes=i)
+                }
+                for i in range(posts_per_user)
+            ]).all()
+            if posts:
+                db.execute(insert(PostTarget), [row for post_id in posts for row in post_target_rows(post_id, platforms)])
+                db.execute(insert(PostResult), [
+                    {"post_id": post_id, "platform": name, "platform_post_id": f"{name}-{post_id}", "status": "success", "published_at": now}
+                    for post_id in posts for name in platforms
+                ])
+        db.commit()
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentile nearest-rank di una lista già ordinata"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(int(round(fraction * len(values) + 0.5)) - 1, 0))]
+
+async def run_scenario(send: Callable[[], Awaitable[httpx.Response]], total: int, concurrency: int) -> Dict[str, float]:
+    """Esegue total richieste con concurrency client contemporanei"""
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def client_loop():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started_at = time.perf_counter()
+            response = await send()
+            latencies.append(time.perf_counter() - started_at)
+            if response.status_code >= 400:
+                errors += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2)
+    }
+
+async def run_benchmark(args, stubs: PlatformStubs) -> Dict[str, Dict[str, float]]:
+    import main
+    from utils import http_client
+    from utils.jwt import create_access_token
+
+    platforms = args.platforms.split(",")
+    # Il client condiviso verso le piattaforme usa gli stub: il lifespan non lo ricrea
+    http_client._client = httpx.AsyncClient(transport=stubs.transport(), timeout=http_client.HTTP_TIMEOUT)
+    tokens = [create_access_token({"sub": str(user_id)}) for user_id in range(1, args.users + 1)]
+
+    def auth_headers() -> Dict[str, str]:
+        return {"Authorization": f"Bearer {random.choice(tokens)}"}
+
+    results = {}
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+            requests = {
+                "login": lambda: client.post("/auth/login", json={
+                    "email": f"bench{random.randrange(args.users)}@example.com", "password": PASSWORD
+                }),
+                "create": lambda: client.post("/posts/create", headers=auth_headers(), json={
+                    "content": "Post di benchmark", "platforms": platforms
+                }),
+                "create_instagram": lambda: client.post("/posts/create", headers=auth_headers(), json={
+                    "content": "Post di benchmark", "platforms": ["instagram"], "media_urls": [INSTAGRAM_MEDIA_URL]
+                }),
+                "history": lambda: client.get("/posts/history", headers=auth_headers(), params={"limit": 20}),
+            }
+            for name in args.scenarios.split(","):
+                # Qualche richiesta di riscaldamento (cache, connessioni del pool) non misurata
+                for _ in range(min(args.concurrency, args.requests)):
+                    await requests[name]()
+                results[name] = await run_scenario(requests[name], args.requests, args.concurrency)
+
+    return results
+
+def parse_override(value: str, default: StubConfig) -> Tuple[str, StubConfig]:
+    """--override piattaforma:campo=valore,... -> configurazione stub della piattaforma"""
+    platform_name, _, assignments = value.partition(":")
+    fields = {field.name: field.type for field in dataclasses.fields(StubConfig)}
+    changes = {}
+    for assignment in filter(None, assignments.split(",")):
+        key, _, raw = assignment.partition("=")
+        if key not in fields:
+            raise argparse.ArgumentTypeError(f"campo stub sconosciuto: {key}")
+        changes[key] = raw if key == "rate_limit" else float(raw)
+    return platform_name, dataclasses.replace(default, **changes)
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict, tolerance: float) -> bool:
+    """Stampa le variazioni rispetto alla baseline; False se una rotta è peggiorata oltre la tolleranza"""
+    ok = True
+    print(f"\nconfronto con la baseline ({baseline['created_at']}, tolleranza {tolerance:.0%})")
+    print(f"{'scenario':<18}{'p95 ms':>18}{'req/s':>18}")
+    for name, stats in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        p95_change = stats["p95_ms"] / reference["p95_ms"] - 1 if reference["p95_ms"] else 0
+        rps_change = stats["throughput_rps"] / reference["throughput_rps"] - 1 if reference["throughput_rps"] else 0
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        ok = ok and not regressed
+        print(f"{name:<18}{reference['p95_ms']:>8.1f} {p95_change:>+8.0%}{reference['throughput_rps']:>8.1f} {rps_change:>+8.0%}"
+              + ("  REGRESSIONE" if regressed else ""))
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="richieste misurate per scenario")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--posts-per-user", type=int, default=100)
+    parser.add_argument("--platforms", default="facebook,linkedin,twitter")
+    parser.add_argument("--publish-mode", choices=("inline", "queue"), default="inline")
+    parser.add_argument("--latency", type=float, default=0.1, help="latenza media delle piattaforme (secondi)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probabilità di un 5xx per chiamata")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="probabilità di un 429 per chiamata")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After dei 429 simulati (secondi)")
+    parser.add_argument("--override", action="append", default=[], metavar="PIATTAFORMA:CAMPO=VALORE,...",
+                        help="configurazione stub di una sola piattaforma (ripetibile)")
+    parser.add_argument("--app-rate-limits", action="store_true", help="mantieni i rate limit dell'applicazione")
+    parser.add_argument("--save-baseline", metavar="NOME")
+    parser.add_argument("--compare", metavar="NOME")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    configure_environment(args)
+    stubs = PlatformStubs(default=StubConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after
+    ))
+    try:
+        stubs.overrides.update(parse_override(value, stubs.default) for value in args.override)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+
+    seed_database(args.users, args.posts_per_user, args.platforms.split(","))
+    results = asyncio.run(run_benchmark(args, stubs))
+
+    print(f"{args.concurrency} client, {args.requests} richieste per scenario, "
+          f"{args.users} utenti x {args.posts_per_user} post, latenza piattaforme {args.latency * 1000:g}ms\n")
+    print(f"{'scenario':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errori':>8}")
+    for name, stats in results.items():
+        print(f"{name:<18}{stats['throughput_rps']:>10.1f}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['errors']:>8}")
+    for name, stats in sorted(stubs.stats.items()):
+        print(f"stub {name}: {stats.requests} chiamate, {stats.errors} errori, {stats.rate_limited} rate limited")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("scenarios", "save_baseline", "compare", "tolerance")}
+    if args.save_baseline:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        path = BASELINES_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps({
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "config": config,
+            "results": results
+        }, indent=2) + "\n")
+        print(f"\nbaseline salvata in {path}")
+
+    if args.compare:
+        baseline = json.loads((BASELINES_DIR / f"{args.compare}.json").read_text())
+        if baseline["config"] != config:
+            print("\nattenzione: la baseline è stata registrata con parametri diversi")
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Stand-in locali delle API social per i benchmark: un httpx.MockTransport che risponde come
+Graph API (Facebook/Instagram), LinkedIn, Twitter e TikTok agli endpoint usati da services/publisher.py.
+
+Latenza, percentuale di errori 5xx e comportamento dei 429 sono configurabili per piattaforma.
+Instagram usa lo stesso host della Graph API di Facebook: le sue chiamate sono riconosciute dal
+path (container /media e /media_publish) e dal campo instagram_business_account, così ha un
+profilo e statistiche separati.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+PLATFORM_HOSTS = {
+    "graph.facebook.com": "facebook",
+    "graph.instagram.com": "instagram",
+    "api.linkedin.com": "linkedin",
+    "www.linkedin.com": "linkedin",
+    "api.twitter.com": "twitter",
+    "open-api.tiktok.com": "tiktok",
+}
+
+def stub_platform(request: httpx.Request) -> str:
+    """Piattaforma simulata a cui è destinata una richiesta"""
+    platform = PLATFORM_HOSTS.get(request.url.host, "unknown")
+    if platform == "facebook" and (
+        request.url.path.endswith(("/media", "/media_publish"))
+        or "instagram_business_account" in request.url.params.get("fields", "")
+    ):
+        return "instagram"
+    return platform
+
+@dataclass
+class StubConfig:
+    """Comportamento di una piattaforma simulata"""
+    latency: float = 0.1
+    # Variazione casuale della latenza (frazione di latency, distribuzione uniforme)
+    jitter: float = 0.2
+    # Probabilità che una chiamata risponda 503
+    error_rate: float = 0.0
+    # Probabilità di un 429 con Retry-After, oppure limite per finestra (richieste/secondi)
+    rate_limit_rate: float = 0.0
+    rate_limit: Optional[str] = None
+    retry_after: float = 1.0
+
+@dataclass
+class StubStats:
+    requests: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+
+@dataclass
+class PlatformStubs:
+    """Tutte le piattaforme simulate, con una configurazione di default e override per piattaforma"""
+    default: StubConfig = field(default_factory=StubConfig)
+    overrides: Dict[str, StubConfig] = field(default_factory=dict)
+    stats: Dict[str, StubStats] = field(default_factory=dict)
+    _windows: Dict[str, Tuple[float, int]] = field(default_factory=dict)
+
+    def config(self, platform: str) -> StubConfig:
+        return self.overrides.get(platform, self.default)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def _window_exceeded(self, platform: str, config: StubConfig) -> Optional[float]:
+        """Secondi al reset della finestra se il limite per finestra è superato"""
+        if not config.rate_limit:
+            return None
+        limit, seconds = (float(value) for value in config.rate_limit.split("/"))
+        started_at, count = self._windows.get(platform, (time.monotonic(), 0))
+        now = time.monotonic()
+        if now - started_at >= seconds:
+            started_at, count = now, 0
+        self._windows[platform] = (started_at, count + 1)
+        return started_at + seconds - now if count + 1 > limit else None
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        platform = stub_platform(request)
+        config = self.config(platform)
+        stats = self.stats.setdefault(platform, StubStats())
+        stats.requests += 1
+
+        await asyncio.sleep(max(config.latency * (1 + random.uniform(-config.jitter, config.jitter)), 0))
+
+        reset_in = self._window_exceeded(platform, config)
+        if reset_in is not None or random.random() < config.rate_limit_rate:
+            stats.rate_limited += 1
+            return rate_limit_response(platform, reset_in if reset_in is not None else config.retry_after)
+        if random.random() < config.error_rate:
+            stats.errors += 1
+            if platform in ("facebook", "instagram"):
+                return httpx.Response(500, json={"error": {"message": "Service unavailable", "code": 2, "is_transient": True}})
+            return httpx.Response(503, text="Service Unavailable")
+
+        return platform_response(request)
+
+def rate_limit_response(platform: str, retry_after: float) -> httpx.Response:
+    """Risposta di limite superato nel formato della piattaforma"""
+    if platform in ("facebook", "instagram"):
+        # La Graph API risponde 400 con codice 17 e comunica l'utilizzo negli header
+        return httpx.Response(
+            400,
+            json={"error": {"message": "User request limit reached", "code": 17}},
+            headers={"x-business-use-case-usage": '{"1": [{"call_count": 100, "estimated_time_to_regain_access": 1}]}'}
+        )
+    headers = {"retry-after": f"{retry_after:.0f}"}
+    if platform == "twitter":
+        headers.update({"x-rate-limit-remaining": "0", "x-rate-limit-reset": f"{time.time() + retry_after:.0f}"})
+    return httpx.Response(429, json={"error": "rate limited"}, headers=headers)
+
+def platform_response(request: httpx.Request) -> httpx.Response:
+    """Risposta di successo agli endpoint chiamati dagli adapter e dal flusso OAuth"""
+    path = request.url.path
+    if path.endswith("/me/accounts"):
+        return httpx.Response(200, json={"data": [{
+            "id": "page-1",
+            "access_token": "page-token",
+            "instagram_business_account": {"id": "ig-1"}
+        }]})
+    if path.endswith("/feed"):
+        return httpx.Response(200, json={"id": f"page-1_{random.randrange(10**9)}"})
+    if path.endswith("/media_publish"):
+        return httpx.Response(200, json={"id": f"ig-post-{random.randrange(10**9)}"})
+    if path.endswith("/media"):
+        return httpx.Response(200, json={"id": f"container-{random.randrange(10**9)}"})
+    if path.endswith("/people/~"):
+        return httpx.Response(200, json={"id": "li-person-1", "localizedFirstName": "Bench"})
+    if path.endswith("/ugcPosts"):
+        return httpx.Response(201, json={"id": f"urn:li:share:{random.randrange(10**9)}"})
+    if path.endswith("/tweets"):
+        return httpx.Response(201, json={"data": {"id": str(random.randrange(10**15)), "text": ""}})
+    if path.endswith("/users/me"):
+        return httpx.Response(200, json={"data": {"id": "tw-1", "username": "bench"}})
+    if "/share/video/upload" in path:
+        return httpx.Response(200, json={"share_id": f"tt-{random.randrange(10**9)}"})
+    if "access_token" in path or "accessToken" in path or path.endswith("/oauth2/token"):
+        return httpx.Response(200, json={"access_token": "bench-token", "refresh_token": "bench-refresh", "expires_in": 3600})
+    return httpx.Response(404, json={"error": "not found"})
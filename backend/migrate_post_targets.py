@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Migrazione dei post esistenti: copia le piattaforme e i media salvati come JSON nelle
+colonne posts.platforms e posts.media_urls nelle tabelle post_targets e post_media.
+
+Lo script crea le tabelle mancanti e migra a batch solo i post senza righe in post_targets,
+quindi può essere interrotto e rieseguito.
+
+Uso: python migrate_post_targets.py [--batch-size 1000]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Aggiungi la directory app al path Python
+app_dir = Path(__file__).parent / "app"
+sys.path.insert(0, str(app_dir))
+
+from sqlalchemy import insert, select
+
+from db.database import SessionLocal, create_tables, engine
+from models.models import Post, PostMedia, PostTarget
+from services.post_targets import post_media_rows, post_target_rows
+
+def migrate(batch_size: int) -> None:
+    """Migra i post a batch in ordine di ID, un commit per batch"""
+    migrated = skipped = 0
+    last_id = 0
+
+    with SessionLocal() as db:
+        while True:
+            rows = db.execute(select(Post.id, Post.platforms, Post.media_urls).filter(
+                Post.id > last_id,
+                ~Post.targets.any()
+            ).order_by(Post.id).limit(batch_size)).all()
+            if not rows:
+                break
+
+            target_rows = []
+            media_rows = []
+            for post_id, platforms, media_urls in rows:
+                try:
+                    target_rows.extend(post_target_rows(post_id, json.loads(platforms)))
+                    media_rows.extend(post_media_rows(post_id, json.loads(media_urls) if media_urls else []))
+                    migrated += 1
+                except (TypeError, ValueError) as e:
+                    print(f"  ⚠️  Post {post_id} ignorato, JSON non valido: {e}")
+                    skipped += 1
+
+            if target_rows:
+                db.execute(insert(PostTarget), target_rows)
+            if media_rows:
+                db.execute(insert(PostMedia), media_rows)
+            db.commit()
+
+            last_id = rows[-1][0]
+            print(f"  ... {migrated} post migrati (ultimo ID {last_id})")
+
+    print(f"\n✅ Migrazione completata: {migrated} post migrati, {skipped} ignorati")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    try:
+        print(f"🔄 Migrazione di piattaforme e media su {engine.url}")
+        # Crea post_targets e post_media se mancano
+        create_tables()
+        migrate(args.batch_size)
+    except Exception as e:
+        print(f"❌ Errore durante la migrazione: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
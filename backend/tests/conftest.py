@@ -0,0 +1,19 @@
+"""
+Configurazione comune dei test: l'applicazione legge DATABASE_URL e le altre variabili
+all'import, quindi vanno impostate qui prima di importare qualunque modulo di app/.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Aggiungi la directory app al path Python
+app_dir = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(app_dir))
+
+# Database SQLite temporaneo e nessun task in background
+test_dir = tempfile.mkdtemp(prefix="tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(test_dir, 'test.db')}"
+os.environ["MEDIA_ROOT"] = os.path.join(test_dir, "media")
+os.environ["SCHEDULER_ENABLED"] = "false"
@@ -0,0 +1,132 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import httpx
+import pytest
+from sqlalchemy import event, insert
+
+import main
+from db.database import SessionLocal, async_engine, create_tables
+from models.models import Post, PostResult, PostTarget, User
+from services.post_targets import post_target_rows
+from utils.jwt import create_access_token
+
+PLATFORMS = ["facebook", "linkedin", "twitter"]
+
+def seed_user(username: str, created_ats: List[Optional[datetime]]) -> int:
+    """Utente con un post per ogni data indicata, ciascuno con le sue piattaforme e un PostResult per piattaforma.
+
+    Con None la data è il default del database (CURRENT_TIMESTAMP, al secondo su SQLite).
+    """
+    create_tables()
+    with SessionLocal() as db:
+        user_id = db.scalar(insert(User).returning(User.id), [
+            {"email": f"{username}@example.com", "username": username, "hashed_password": "x"}
+        ])
+        post_ids = db.scalars(insert(Post).returning(Post.id), [
+            {
+                "user_id": user_id,
+                "content": f"Post {i}",
+                "platforms": json.dumps(PLATFORMS),
+                "status": "published",
+                **({"created_at": created_at} if created_at else {})
+            }
+            for i, created_at in enumerate(created_ats)
+        ]).all()
+        db.execute(insert(PostTarget), [row for post_id in post_ids for row in post_target_rows(post_id, PLATFORMS)])
+        db.execute(insert(PostResult), [
+            {"post_id": post_id, "platform": platform, "status": "success", "platform_post_id": f"{platform}-{post_id}"}
+            for post_id in post_ids for platform in PLATFORMS
+        ])
+        db.commit()
+    return user_id
+
+def make_client(user_id: int) -> httpx.AsyncClient:
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test", headers=headers)
+
+@pytest.fixture(scope="module")
+def user_id():
+    now = datetime.utcnow()
+    return seed_user("history", [now - timedelta(minutes=i) for i in range(60)])
+
+@pytest.fixture
+def client(user_id):
+    return make_client(user_id)
+
+@contextmanager
+def count_queries():
+    """Conta le query eseguite sull'engine asincrono usato dalle rotte"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+@pytest.mark.asyncio
+async def test_history_query_count_is_constant(client):
+    counts = {}
+    async with client:
+        # Richiesta di riscaldamento: eventuali cache dell'autenticazione non alterano il conteggio
+        await client.get("/posts/history")
+        for limit in (5, 20, 50):
+            with count_queries() as statements:
+                response = await client.get("/posts/history", params={"limit": limit})
+            assert response.status_code == 200
+            items = response.json()
+            assert len(items) == limit
+            assert all(len(item["results"]) == len(PLATFORMS) for item in items)
+            assert all(item["platforms"] == PLATFORMS for item in items)
+            counts[limit] = len(statements)
+
+    assert counts[5] > 0
+    assert counts[5] == counts[20] == counts[50], counts
+
+@pytest.mark.asyncio
+async def test_history_pages_through_posts_created_in_the_same_second():
+    # Un solo INSERT con il default CURRENT_TIMESTAMP: tutti i post hanno lo stesso created_at, che
+    # su SQLite è salvato senza microsecondi e va confrontato con il cursore nello stesso formato
+    user_id = seed_user("same-second", [None] * 23)
+
+    seen = []
+    pages = 0
+    params = {"limit": 5}
+    async with make_client(user_id) as client:
+        # Limite di sicurezza: un cursore che non avanza ripeterebbe la stessa pagina all'infinito
+        while pages < 10:
+            response = await client.get("/posts/history", params=params)
+            assert response.status_code == 200
+            seen.extend(item["id"] for item in response.json())
+            pages += 1
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if next_cursor is None:
+                assert "Link" not in response.headers
+                break
+            assert 'rel="next"' in response.headers["Link"]
+            params = {"limit": 5, "cursor": next_cursor}
+
+    # Nessun duplicato né buco: tutti i post, dal più recente (id più alto) al più vecchio
+    assert pages == 5
+    assert len(seen) == len(set(seen)) == 23
+    assert seen == sorted(seen, reverse=True)
+
+@pytest.mark.asyncio
+async def test_history_rejects_malformed_cursor(client):
+    async with client:
+        response = await client.get("/posts/history", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_history_rejects_offset(client):
+    async with client:
+        response = await client.get("/posts/history", params={"offset": 20})
+        first_page = await client.get("/posts/history", params={"offset": 0})
+    assert response.status_code == 400
+    assert first_page.status_code == 200